@@ -1,23 +1,59 @@
+import time
+STARTED = time.perf_counter()  # start of the start-up timing report
+
 from dash import Dash
 import dash_bootstrap_components as dbc
-from db import init_db, get_products, import_products_from_csv
+from flask import Response, request
+from db import init_db, import_products_from_csv, get_pool_stats, get_popular_cache_stats
+from catalogue import CatalogueStore
+from metrics import StartupTimer, instrument_app, gauge, register
 import os
+import platform
+
+# Time each phase of start-up; printed below and served at /metrics
+startup = register(StartupTimer("pos_startup_seconds", "Time spent in each phase of start-up", STARTED))
+startup.phase("imports")
 
 # Initialize the database (creates tables if needed)
 init_db()
+startup.phase("init_db")
+
+# Load the catalogue snapshot; it is swapped in place whenever products change
+catalogue = CatalogueStore()
+startup.phase("load catalogue")
 
-# Import sample products if the database is empty
-products = get_products()
-if not products["Home"]:  # Check if no products exist
+# Import sample products if the database is empty (the snapshot reloads itself)
+if not len(catalogue.current().index):  # Check if no products exist
     sample_file = "products.csv"
     if os.path.exists(sample_file):
         print(f"Importing sample products from {sample_file}")
         import_products_from_csv(sample_file)
     else:
         print(f"Warning: {sample_file} not found. Please create it to import sample products.")
+    startup.phase("import sample products")
+
+# Keep the order basket in the browser; only "Place Order" reaches the server
+CLIENTSIDE_BASKET = True
+
+# Multi-till mode: set POS_SYNC_URL (e.g. http://192.168.1.10:8060) to forward
+# checkouts to a till_server.py process and receive its catalogue
+SYNC_SERVER_URL = os.environ.get("POS_SYNC_URL")
+TILL_ID = os.environ.get("POS_TILL_ID", platform.node())
+till_sync = None
+if SYNC_SERVER_URL:
+    from till_sync import SyncClient
+    till_sync = SyncClient(SYNC_SERVER_URL, TILL_ID).start()
 
-# Load products from the database
-products = get_products()
+# Write-behind sales: set POS_WRITE_BEHIND=1 to journal checkouts and write them
+# to the database from a background thread, so "Place Order" returns at once
+sale_writer = None
+if os.environ.get("POS_WRITE_BEHIND") == "1":
+    from sale_writer import SaleWriter
+    try:
+        sale_writer = SaleWriter().start()
+    except RuntimeError as e:
+        # Another worker owns the journal; this one records checkouts directly
+        print(f"Write-behind sales disabled: {e}")
 
 # Create the Dash app
 app = Dash(
@@ -26,16 +62,55 @@ app = Dash(
     suppress_callback_exceptions=True
 )
 app.title = "POS System"
+startup.phase("create app")
 
 # Import these after creating app to avoid circular imports
 from layout import get_layout
+from layout_cache import LayoutCache, initial_layout_key
 from callbacks import register_callbacks
 
+def serve_layout():
+    """Build the layout from the current catalogue on every page load."""
+    snapshot = catalogue.current()
+    return get_layout(snapshot.products, catalogue_version=snapshot.version)
+
 # Set the app layout using the products data
-app.layout = get_layout(products)
+app.layout = serve_layout
+
+# Page loads get the serialized layout from the layout cache; it is only
+# rebuilt when something it shows has changed, and survives restarts on disk
+layout_cache = LayoutCache()
+
+@app.server.before_request
+def serve_cached_layout():
+    if request.path.endswith("/_dash-layout"):
+        key = initial_layout_key(catalogue.current())
+        return Response(layout_cache.get(key, serve_layout), mimetype="application/json")
 
 # Register all callbacks with the app
-register_callbacks(app, products)
+register_callbacks(app, catalogue, clientside_basket=CLIENTSIDE_BASKET, till_sync=till_sync,
+                   sale_writer=sale_writer)
+startup.phase("register callbacks")
+
+# Time callbacks and serve Prometheus metrics at /metrics
+instrument_app(app)
+gauge("pos_catalogue_version", "Catalogue version currently served", lambda: catalogue.current().version)
+gauge("pos_db_pool_connections", "Open pooled SQLite connections", lambda: get_pool_stats()["size"])
+gauge("pos_db_pool_wait_seconds_total", "Time spent waiting for a pooled connection",
+      lambda: get_pool_stats()["wait_time"])
+gauge("pos_popular_cache_hits_total", "Popular products served from the cache",
+      lambda: get_popular_cache_stats()["hits"])
+gauge("pos_popular_cache_misses_total", "Popular products read from the database",
+      lambda: get_popular_cache_stats()["misses"])
+if sale_writer is not None:
+    gauge("pos_sale_queue_depth", "Checkouts journaled but not yet written", lambda: sale_writer.stats()["queued"])
+    gauge("pos_sale_flush_latency_seconds", "Checkout-to-commit time of the last written batch",
+          lambda: sale_writer.stats()["last_flush_latency"])
+if till_sync is not None:
+    gauge("pos_sync_queue_depth", "Orders waiting to be sent to the sync server", lambda: till_sync.stats()["queued"])
+startup.phase("metrics")
+print(startup.report())
 
 if __name__ == "__main__":
-    app.run_server(debug=True)
\ No newline at end of file
+    # Development server with the debugger and reloader; serve.py is for production
+    app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,228 @@
+// Client-side order basket: turns button taps into small events, adds/removes
+// lines and renders the order summary in the browser.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    basket: {
+        // Prices are integer pence. pricing is the price-list-prices store: null
+        // for standard prices, {event: true} for the precomputed event price, or a
+        // named list's {markup, overrides}; markups round half up like money.py
+        unitPrice: function (product, pricing, productId) {
+            if (!pricing) {
+                return product.price;
+            }
+            if (pricing.event) {
+                return product.event_price;
+            }
+            var override = pricing.overrides && pricing.overrides[String(productId)];
+            if (override !== undefined && override !== null) {
+                return override;
+            }
+            return Math.floor((product.price * (100 + (pricing.markup || 0)) + 50) / 100);
+        },
+
+        formatPence: function (pence) {
+            var sign = pence < 0 ? "-" : "";
+            pence = Math.abs(pence);
+            var rem = pence % 100;
+            return sign + "£" + Math.floor(pence / 100) + "." + (rem < 10 ? "0" : "") + rem;
+        },
+
+        triggeredId: function () {
+            var triggered = dash_clientside.callback_context.triggered;
+            if (!triggered || !triggered.length || !triggered[0].value) {
+                return null;
+            }
+            var propId = triggered[0].prop_id;
+            var idStr = propId.substring(0, propId.lastIndexOf("."));
+            try {
+                return JSON.parse(idStr);
+            } catch (e) {
+                return idStr;
+            }
+        },
+
+        // Incremented on every tap so repeated taps on one button still change the store
+        tapSeq: 0,
+
+        // The tapped button's value holds the product details the basket needs
+        // (see layout.basket_product), so the page carries no separate catalogue
+        productTap: function () {
+            var btnId = window.dash_clientside.basket.triggeredId();
+            if (!btnId || btnId.type !== "product-button") {
+                return dash_clientside.no_update;
+            }
+            var states = dash_clientside.callback_context.states_list[0] || [];
+            var product = null;
+            for (var i = 0; i < states.length; i++) {
+                if (states[i].id.product_id === btnId.product_id && states[i].id.category === btnId.category) {
+                    product = states[i].value ? JSON.parse(states[i].value) : null;
+                    break;
+                }
+            }
+            return {product_id: btnId.product_id, seq: ++window.dash_clientside.basket.tapSeq, product: product};
+        },
+
+        removeTap: function () {
+            var btnId = window.dash_clientside.basket.triggeredId();
+            if (!btnId || btnId.type !== "remove-button") {
+                return dash_clientside.no_update;
+            }
+            return {index: btnId.index, seq: ++window.dash_clientside.basket.tapSeq};
+        },
+
+        // Add one of a product to the order lines, up to the stock level. Each line
+        // keeps the prices it was added at so a price list switch can re-price it
+        addProduct: function (current, productId, product, pricing) {
+            for (var i = 0; i < current.length; i++) {
+                if (current[i].product_id === productId) {
+                    if (current[i].count < product.stock) {  // Check stock level
+                        current[i].count += 1;
+                    }
+                    return;
+                }
+            }
+            if (product.stock > 0) {  // Only add if stock available
+                current.push({
+                    product_id: productId,
+                    name: product.name,
+                    price: window.dash_clientside.basket.unitPrice(product, pricing, productId),
+                    standard_price: product.price,
+                    event_price: product.event_price,
+                    sku: product.sku,
+                    count: 1
+                });
+            }
+        },
+
+        updateOrder: function (productTap, removeTap, pricing, order) {
+            var basket = window.dash_clientside.basket;
+            var triggered = dash_clientside.callback_context.triggered;
+            var current = (order || []).map(function (item) { return Object.assign({}, item); });
+
+            // Price list switched: re-price the existing lines only
+            if (triggered.length && triggered[0].prop_id === "price-list-prices.data") {
+                return current.map(function (item) {
+                    if (item.standard_price !== undefined) {
+                        var product = {price: item.standard_price, event_price: item.event_price};
+                        item.price = basket.unitPrice(product, pricing, item.product_id);
+                    }
+                    return item;
+                });
+            }
+
+            var source = triggered.length ? triggered[0].prop_id : "";
+
+            if (source === "product-tap.data" && productTap) {
+                if (!productTap.product) {
+                    return dash_clientside.no_update;
+                }
+                basket.addProduct(current, productTap.product_id, productTap.product, pricing);
+                return current;
+            }
+
+            if (source === "remove-tap.data" && removeTap) {
+                var index = removeTap.index;
+                if (index >= 0 && index < current.length) {
+                    if ((current[index].count || 1) > 1) {
+                        current[index].count -= 1;
+                    } else {
+                        current.splice(index, 1);
+                    }
+                }
+                return current;
+            }
+            return dash_clientside.no_update;
+        },
+
+        // Add the scans look_up_scans resolved (see scanner.js); scan-products is
+        // {"scans": [[seq, sku], ...], "products": {sku: product details or null}}
+        addScans: function (scanProducts, applied, order, pricing) {
+            var basket = window.dash_clientside.basket;
+            var products = (scanProducts && scanProducts.products) || {};
+            var scans = ((scanProducts && scanProducts.scans) || []).filter(function (scan) {
+                return scan[0] > (applied || 0);
+            });
+            if (!scans.length) {
+                return [dash_clientside.no_update, dash_clientside.no_update, dash_clientside.no_update];
+            }
+            var current = (order || []).map(function (item) { return Object.assign({}, item); });
+            var unknown = [];
+            scans.forEach(function (scan) {
+                var product = products[scan[1]];
+                if (!product) {
+                    unknown.push(scan[1]);
+                    return;
+                }
+                basket.addProduct(current, product.id, product, pricing);
+            });
+            var message = unknown.length ? "Unknown barcode: " + unknown.join(", ") : null;
+            return [current, scans[scans.length - 1][0], message];
+        },
+
+        component: function (namespace, type, props) {
+            return {namespace: namespace, type: type, props: props};
+        },
+
+        renderOrder: function (order) {
+            var basket = window.dash_clientside.basket;
+            var html = function (type, props) { return basket.component("dash_html_components", type, props); };
+            var dbc = function (type, props) { return basket.component("dash_bootstrap_components", type, props); };
+
+            if (!order || !order.length) {
+                return [
+                    html("Div", {
+                        children: "No items selected.",
+                        style: {paddingLeft: "8px", paddingTop: "8px"}
+                    }),
+                    "Total: £0.00",
+                    "Total: £0.00"
+                ];
+            }
+
+            var rows = order.map(function (item, i) {
+                var count = item.count || 1;
+                var subtotal = item.price * count;
+                return dbc("Row", {
+                    children: [
+                        dbc("Col", {
+                            children: html("Div", {children: [
+                                html("Span", {
+                                    children: (i + 1) + ". " + item.name + " (x" + count + ")",
+                                    style: {fontSize: "16px", fontWeight: "bold"}
+                                }),
+                                html("Br", {}),
+                                html("Span", {children: basket.formatPence(item.price) + " each", style: {fontSize: "13px"}}),
+                                html("Br", {}),
+                                html("Span", {children: "Subtotal: " + basket.formatPence(subtotal), style: {fontSize: "13px"}})
+                            ]}),
+                            width: 8,
+                            style: {paddingRight: "5px", paddingLeft: "8px"}
+                        }),
+                        dbc("Col", {
+                            children: dbc("Button", {
+                                children: "Remove",
+                                id: {type: "remove-button", index: i},
+                                color: "danger",
+                                size: "sm",
+                                n_clicks: 0,
+                                style: {fontSize: "12px", padding: "3px 8px"}
+                            }),
+                            width: 4,
+                            style: {textAlign: "right", paddingLeft: "0px", paddingRight: "8px"}
+                        })
+                    ],
+                    align: "center",
+                    style: {
+                        marginBottom: "3px",
+                        paddingTop: "3px",
+                        paddingBottom: "3px",
+                        borderBottom: "1px solid #f0f0f0"
+                    }
+                });
+            });
+
+            var total = order.reduce(function (sum, item) { return sum + item.price * (item.count || 1); }, 0);
+            var totalText = "Total: " + basket.formatPence(total);
+            return [rows, totalText, totalText];
+        }
+    }
+});
@@ -0,0 +1,20 @@
+// Infinite scroll for the category grids: scrolling a grid near its end
+// presses its "Show more" button, which appends the next page of products.
+(function () {
+    // Pixels from the bottom at which the next page is requested
+    var LOAD_MARGIN = 200;
+
+    document.addEventListener("scroll", function (event) {
+        var container = event.target;
+        // Scrolling the page itself targets the document, which has no scrollTop
+        if (!(container instanceof Element) ||
+                container.scrollTop + container.clientHeight < container.scrollHeight - LOAD_MARGIN) {
+            return;
+        }
+        var button = container.querySelector("[id*='\"type\":\"load-more\"']");
+        // Disabled while a page is on its way; hidden once everything is shown
+        if (button && !button.disabled && button.offsetParent !== null) {
+            button.click();
+        }
+    }, true);
+})();
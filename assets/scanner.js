@@ -0,0 +1,56 @@
+// Barcode scanner input. A keyboard-wedge scanner types the SKU and presses
+// Enter; each scan gets a sequence number and the whole list of scans the
+// order has not yet taken is written to scan-queue. A callback that misses an
+// update still sees every scan, and scan-applied (the last seq added to the
+// order) stops a scan being added twice, so scans arriving faster than the
+// callbacks run are neither dropped nor duplicated.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    scanner: {
+        seq: 0,
+        pending: [],  // [seq, sku] not yet acknowledged through scan-applied
+
+        push: function (sku) {
+            var scanner = window.dash_clientside.scanner;
+            scanner.pending.push([++scanner.seq, sku]);
+            window.dash_clientside.set_props("scan-queue", {data: scanner.pending.slice()});
+        },
+
+        // Called with scan-applied: scans up to that seq are in the order
+        acknowledge: function (applied) {
+            var scanner = window.dash_clientside.scanner;
+            scanner.pending = scanner.pending.filter(function (scan) { return scan[0] > (applied || 0); });
+        }
+    }
+});
+
+(function () {
+    function isEditable(element) {
+        var tag = element && element.tagName;
+        return tag === "INPUT" || tag === "TEXTAREA" || tag === "SELECT" || (element && element.isContentEditable);
+    }
+
+    document.addEventListener("keydown", function (event) {
+        var input = document.getElementById("scan-input");
+        if (!input) {
+            return;
+        }
+        if (event.target === input) {
+            if (event.key === "Enter") {
+                // Take the code and clear the field at once, before the next scan starts typing
+                event.preventDefault();
+                event.stopPropagation();
+                var sku = input.value.trim();
+                input.value = "";
+                if (sku) {
+                    window.dash_clientside.scanner.push(sku);
+                }
+            }
+            return;
+        }
+        // A scan while a product button (or nothing) has focus: send the keys to the scan field
+        if (event.key.length === 1 && !event.ctrlKey && !event.metaKey && !event.altKey &&
+                !isEditable(event.target)) {
+            input.focus();
+        }
+    }, true);
+})();
@@ -0,0 +1,97 @@
+"""Concurrent checkout benchmark: several till processes selling from one products.db.
+
+Each worker process records random baskets through db.record_order() as fast
+as it can. At the end the script checks that every unit of stock taken off
+was sold exactly once (no lost updates, no oversell) and prints sales/sec.
+
+    python benchmarks/concurrent_checkout.py --tills 4 --orders 500
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+
+def setup(db_file, products, stock):
+    """Create a fresh database with the given number of products."""
+    db.DB_FILE = db_file
+    db.init_db()
+    with db.get_db_connection() as conn:
+        conn.execute("INSERT INTO categories (name) VALUES ('Bench')")
+        conn.executemany(
+            "INSERT INTO products (category_id, name, price_pence, event_price_pence, sku, stock) "
+            "VALUES (1, ?, ?, ?, ?, ?)",
+            [(f"Product {i}", 250, 275, f"B{i:05d}", stock) for i in range(products)]
+        )
+    db.close_pool()
+
+
+def till(db_file, products, orders, lines, seed, results):
+    """Record orders from one till process and report what it sold."""
+    db.DB_FILE = db_file
+    rng = random.Random(seed)
+    sold = rejected = 0
+    start = time.perf_counter()
+    for _ in range(orders):
+        basket = [(rng.randint(1, products), rng.randint(1, 3), 250) for _ in range(lines)]
+        try:
+            if db.record_order(basket):
+                sold += sum(quantity for _, quantity, _ in basket)
+        except db.OutOfStockError:
+            rejected += 1
+    results.put((sold, rejected, time.perf_counter() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tills", type=int, default=4, help="concurrent writer processes")
+    parser.add_argument("--orders", type=int, default=500, help="orders per till")
+    parser.add_argument("--lines", type=int, default=3, help="lines per order")
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--stock", type=int, default=10000, help="starting stock per product")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "bench.db")
+        setup(db_file, args.products, args.stock)
+
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=till, args=(db_file, args.products, args.orders, args.lines, seed, results))
+            for seed in range(args.tills)
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        outcomes = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        db.DB_FILE = db_file
+        with db.get_db_connection() as conn:
+            remaining = conn.execute("SELECT SUM(stock), MIN(stock) FROM products").fetchone()
+            recorded = conn.execute("SELECT COUNT(*), SUM(item_count) FROM orders").fetchone()
+        db.close_pool()
+
+    sold = sum(s for s, _, _ in outcomes)
+    rejected = sum(r for _, r, _ in outcomes)
+    consistent = remaining[0] == args.products * args.stock - sold and remaining[1] >= 0 and recorded[1] == sold
+    print(f"tills={args.tills} orders/till={args.orders} lines/order={args.lines}")
+    print(f"orders recorded: {recorded[0]}  rejected (out of stock): {rejected}")
+    print(f"units sold: {sold}  stock left: {remaining[0]}  lowest stock: {remaining[1]}")
+    print(f"elapsed: {elapsed:.2f}s  orders/sec: {recorded[0] / elapsed:.0f}  "
+          f"sales lines/sec: {recorded[0] * args.lines / elapsed:.0f}")
+    print("stock consistent" if consistent else "STOCK MISMATCH")
+    return 0 if consistent else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
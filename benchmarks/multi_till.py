@@ -0,0 +1,134 @@
+"""Multi-till test: several till processes forwarding orders to one sync server.
+
+Starts till_server.py on a scratch database, then several till processes,
+each with its own local database and journal. Every till first receives the
+catalogue from the server, then takes orders as fast as it can while the
+server is stopped and restarted part-way through. At the end the central
+database must hold every order exactly once.
+
+    python benchmarks/multi_till.py --tills 4 --orders 500
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_file, port):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "till_server.py"), "--db", db_file,
+         "--host", "127.0.0.1", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("sync server did not start")
+
+
+def till(workdir, till_id, url, orders, results):
+    """Take orders on one till and wait until the server has them all."""
+    import till_sync
+
+    till_sync.RETRY_DELAY = 0.2
+    db.DB_FILE = os.path.join(workdir, f"{till_id}.db")
+    db.init_db()
+    client = till_sync.SyncClient(url, till_id, os.path.join(workdir, f"{till_id}.journal")).start()
+    while client.catalogue_version < 0:
+        time.sleep(0.05)
+
+    products = [(category, row) for category, rows in db.get_products().items()
+                if category != "Home" for row in rows]
+    rng = random.Random(till_id)
+    start = time.perf_counter()
+    for _ in range(orders):
+        basket = [{"category": category, "name": row[0], "price": row[1], "count": rng.randint(1, 3)}
+                  for category, row in rng.sample(products, 3)]
+        client.submit(basket)
+    taken = time.perf_counter() - start
+    while len(client.journal):
+        time.sleep(0.05)
+    delivered = time.perf_counter() - start
+    client.stop(timeout=0.5)
+    results.put((till_id, client.sent, len(client.rejected), taken, delivered))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tills", type=int, default=4)
+    parser.add_argument("--orders", type=int, default=500, help="orders per till")
+    parser.add_argument("--outage", type=float, default=0.5, help="seconds the server is down mid-run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        central = os.path.join(workdir, "central.db")
+        db.DB_FILE = central
+        db.init_db()
+        db.bulk_import_products(os.path.join(ROOT, "products.csv"))
+        db.close_pool()
+
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        server = start_server(central, port)
+
+        results = multiprocessing.Queue()
+        tills = [multiprocessing.Process(target=till, args=(workdir, f"till{i}", url, args.orders, results))
+                 for i in range(args.tills)]
+        start = time.perf_counter()
+        for process in tills:
+            process.start()
+
+        # Drop the link while the tills are busy, then bring it back
+        time.sleep(0.3)
+        server.terminate()
+        server.wait()
+        time.sleep(args.outage)
+        server = start_server(central, port)
+
+        outcomes = [results.get(timeout=300) for _ in tills]
+        elapsed = time.perf_counter() - start
+        for process in tills:
+            process.join()
+        server.terminate()
+        server.wait()
+
+        db.DB_FILE = central
+        with db.get_db_connection() as conn:
+            recorded, distinct = conn.execute("SELECT COUNT(*), COUNT(DISTINCT client_ref) FROM orders").fetchone()
+        db.close_pool()
+
+    expected = args.tills * args.orders
+    rejected = sum(r for _, _, r, _, _ in outcomes)
+    print(f"tills={args.tills} orders/till={args.orders} outage={args.outage}s")
+    for till_id, sent, till_rejected, taken, done in sorted(outcomes):
+        print(f"  {till_id}: {sent} accepted, {till_rejected} rejected, "
+              f"orders taken in {taken:.2f}s, all delivered after {done:.2f}s")
+    print(f"central orders: {recorded} (distinct refs {distinct}) expected {expected}, rejected {rejected}")
+    print(f"elapsed: {elapsed:.2f}s  orders/min across tills: {recorded / elapsed * 60:.0f}")
+    ok = recorded == distinct == expected and rejected == 0
+    print("all orders delivered exactly once" if ok else "ORDER MISMATCH")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""Price window check: price lists must follow their windows on an open page.
+
+Builds a server-side basket app on a scratch database with one price list
+whose window closes a couple of seconds in and another whose window opens
+then. A product is added while the first is active; once the windows have
+moved, the catalogue poll the page would run must reprice the basket (and
+the order be recorded at standard prices) and make the second list
+selectable. Choosing a list outside its window must be refused. The
+callbacks are driven through the Flask test client, as in benchmarks/run.py.
+
+    python benchmarks/price_windows.py --window 2
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+from run import ROOT, CallbackClient, make_app
+
+ORDER_OUTPUTS = [{"id": "order-store", "property": "data"},
+                 {"id": "refresh-trigger", "property": "data"},
+                 {"id": "order-message", "property": "children"}]
+
+
+def update_order(client, order, changed, product_tap=None, pay_clicks=None, effective=None):
+    """Run the server basket callback; returns the order-store it sends back, or None."""
+    response = client.call(
+        "update_order", ORDER_OUTPUTS,
+        [{"id": "product-tap", "property": "data", "value": product_tap},
+         {"id": "pay-button", "property": "n_clicks", "value": pay_clicks},
+         {"id": "remove-tap", "property": "data", "value": None},
+         {"id": "effective-price-list", "property": "data", "value": effective}],
+        [{"id": "order-store", "property": "data", "value": order},
+         {"id": "refresh-trigger", "property": "data", "value": 0}],
+        changed=[changed])
+    return response.get_json()["response"].get("order-store", {}).get("data")
+
+
+def select(client, selected_list, current_list):
+    """Pick a list from the dropdown; returns select_price_list's response."""
+    return client.call(
+        "select_price_list",
+        [{"id": "price-list", "property": "data"},
+         {"id": "event-pricing-button", "property": "color"},
+         {"id": "event-pricing-button", "property": "style"},
+         {"id": "price-list-select", "property": "value"},
+         {"id": "effective-price-list", "property": "data"}],
+        [{"id": "event-pricing-button", "property": "n_clicks", "value": None},
+         {"id": "price-list-select", "property": "value", "value": selected_list}],
+        [{"id": "price-list", "property": "data", "value": current_list},
+         {"id": "event-pricing-button", "property": "style", "value": {}},
+         {"id": "effective-price-list", "property": "data", "value": current_list}],
+        changed=["price-list-select.value"]).get_json()["response"]
+
+
+def poll(client, categories, snapshot, price_list, effective, options):
+    """Run sync_catalogue as the catalogue-poll interval would; returns its response."""
+    import layout
+
+    return client.call(
+        "sync_catalogue",
+        [{"id": "catalogue-version", "property": "data"},
+         {"id": "category-tabs", "property": "children"},
+         {"id": "category-tabs", "property": "value"},
+         [{"id": {"type": "category-content", "category": c}, "property": "children"} for c in categories],
+         {"id": "rendered-tabs", "property": "data"},
+         {"id": "price-list-select", "property": "options"},
+         {"id": "effective-price-list", "property": "data"}],
+        [{"id": "catalogue-poll", "property": "n_intervals", "value": 1}],
+        [{"id": "catalogue-version", "property": "data",
+          "value": layout.catalogue_state(snapshot.products, snapshot.version)},
+         {"id": "category-tabs", "property": "value", "value": "Home"},
+         {"id": "price-list", "property": "data", "value": price_list},
+         {"id": "effective-price-list", "property": "data", "value": effective},
+         {"id": "price-list-select", "property": "options", "value": options}]).get_json()["response"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--window", type=float, default=2.0, help="seconds until the windows change over")
+    args = parser.parse_args()
+
+    from catalogue import CatalogueStore
+    from layout import price_list_options
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        db.DB_FILE = os.path.join(tmp, "bench.db")
+        db.init_db()
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.bulk_import_products(os.path.join(ROOT, "products.csv"))
+        ends = datetime.now() + timedelta(seconds=args.window)
+        happy_hour = db.add_price_list("Happy hour", markup_percent=-50,
+                                       active_until=ends.strftime("%Y-%m-%d %H:%M:%S"))
+        late = db.add_price_list("Late night", markup_percent=10,
+                                 active_from=ends.strftime("%Y-%m-%d %H:%M:%S"))
+
+        catalogue = CatalogueStore()
+        snapshot = catalogue.current()
+        categories = [c for c in snapshot.products if c != "Home"]
+        product = next(iter(snapshot.index))
+        client = CallbackClient(make_app(catalogue, clientside_basket=False))
+        options = price_list_options()
+        late_selectable = {o["value"]: not o["disabled"] for o in options}
+
+        # The page still offers "Late night" to a stale dropdown; the server must refuse it
+        refused = "price-list" not in select(client, late, happy_hour)
+
+        order = update_order(client, [], "product-tap.data", product_tap={"product_id": product.id, "seq": 1},
+                             effective=happy_hour)
+        happy_price = order[0]["price"]
+
+        time.sleep(max(0.0, (ends - datetime.now()).total_seconds()) + 0.1)
+        response = poll(client, categories, snapshot, happy_hour, happy_hour, options)
+        effective = response.get("effective-price-list", {"data": happy_hour})["data"]
+        new_options = response.get("price-list-select", {"options": options})["options"]
+        late_opened = {o["value"]: not o["disabled"] for o in new_options}
+        order = update_order(client, order, "effective-price-list.data", effective=effective) or order
+        basket_price = order[0]["price"]
+
+        update_order(client, order, "pay-button.n_clicks", pay_clicks=1, effective=effective)
+        with db.get_db_connection() as conn:
+            charged = conn.execute("SELECT total_pence FROM orders ORDER BY id DESC LIMIT 1").fetchone()
+        db.close_pool()
+        os.chdir(ROOT)
+
+    print(f"{product.name}: standard {product.price}p, happy hour {happy_price}p")
+    print(f"before the windows moved: late night selectable {late_selectable[late]}, choosing it refused {refused}")
+    print(f"after: page charged on {effective!r}, basket {basket_price}p, "
+          f"recorded {charged[0] if charged else None}p, late night selectable {late_opened[late]}, "
+          f"happy hour selectable {late_opened[happy_hour]}")
+    ok = (happy_price < product.price and effective is None and basket_price == product.price
+          and charged is not None and charged[0] == product.price
+          and not late_selectable[late] and refused and late_opened[late] and not late_opened[happy_hour])
+    print("price lists followed their windows" if ok else "PRICE WINDOW CHECK FAILED")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
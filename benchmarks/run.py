@@ -0,0 +1,463 @@
+"""Benchmark suite for the POS hot paths, written out as JSON.
+
+For every catalogue size a fresh database is built in a temporary directory
+(catalogue imported from a generated CSV, plus a synthetic sales log), then
+each case is run --repeat times. Cases cover the db.py read and write paths
+and the real Dash callbacks from register_callbacks(), driven through the
+Flask test client exactly as the browser would call them, so no browser is
+needed. Each case reports timings, peak allocations (tracemalloc, one extra
+run) and the number of SQL statements it ran.
+
+    python benchmarks/run.py --output bench.json
+    python benchmarks/run.py --sizes 50000 --sales 10000000 --output big.json
+    python benchmarks/run.py --output new.json --compare bench.json
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db
+import metrics
+
+SALES_DAYS = 120
+SALES_CHUNK = 100000
+LINES_PER_ORDER = 3
+
+
+def categories_for(size):
+    return max(5, min(40, size // 250))
+
+
+def write_catalogue_csv(path, size, rng):
+    """Write a CSV of size products spread over several categories."""
+    categories = [f"Category {i:02d}" for i in range(categories_for(size))]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["category", "name", "price", "sku", "stock"])
+        for i in range(size):
+            writer.writerow([categories[i % len(categories)], f"Product {i:06d}",
+                             f"{rng.uniform(0.5, 30):.2f}", f"SKU{i:06d}", 1000000])
+
+
+def load_sales(product_ids, sales, rng):
+    """Fill product_sales (and orders and the daily rollup) with sales lines over SALES_DAYS."""
+    today = date.today()
+    days = [(today - timedelta(days=d)).isoformat() for d in range(SALES_DAYS)]
+    # A skewed popularity so the top-N ranking has a real answer
+    weights = [1.0 / (i + 1) for i in range(len(product_ids))]
+    with db.get_db_connection() as conn:
+        order_id = 0
+        written = 0
+        while written < sales:
+            chunk = min(SALES_CHUNK, sales - written)
+            orders, lines = [], []
+            for i, product_id in enumerate(rng.choices(product_ids, weights, k=chunk)):
+                if i % LINES_PER_ORDER == 0:
+                    order_id += 1
+                    sale_date = f"{rng.choice(days)} 12:00:00"
+                    orders.append((order_id, sale_date))
+                lines.append((order_id, product_id, rng.randint(1, 3), 250, sale_date))
+            conn.executemany("INSERT INTO orders (id, created_at) VALUES (?, ?)", orders)
+            conn.executemany(
+                "INSERT INTO product_sales (order_id, product_id, quantity, unit_price_pence, sale_date) VALUES (?, ?, ?, ?, ?)",
+                lines
+            )
+            written += chunk
+        conn.execute("DELETE FROM product_sales_daily")
+        conn.execute("""
+            INSERT INTO product_sales_daily (product_id, day, quantity)
+            SELECT product_id, date(sale_date), SUM(quantity)
+            FROM product_sales
+            GROUP BY product_id, date(sale_date)
+        """)
+
+
+def measure(fn, repeat, setup=None):
+    """Run fn repeat times and summarise its timings, SQL statements and allocations."""
+    timings, statements = [], []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        metrics.start_sql_count()
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+        statements.append(metrics.sql_count())
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "runs": repeat,
+        "min_ms": timings[0],
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "max_ms": timings[-1],
+        "sql_statements": statistics.median(statements),
+        "alloc_peak_kb": peak / 1024,
+        "alloc_retained_kb": current / 1024,
+    }
+
+
+class CallbackClient:
+    """Calls an app's server-side callbacks by function name through the Flask test client."""
+
+    def __init__(self, app):
+        self.client = app.server.test_client()
+        self.outputs = {
+            getattr(entry.get("callback"), "__name__", None): output
+            for output, entry in app.callback_map.items()
+        }
+
+    def call(self, name, outputs, inputs, state=(), changed=None):
+        body = {
+            "output": self.outputs[name],
+            "outputs": outputs,
+            "inputs": list(inputs),
+            "state": list(state),
+            "changedPropIds": changed or [f"{inputs[0]['id']}.{inputs[0]['property']}"],
+        }
+        response = self.client.post("/_dash-update-component", json=body)
+        if response.status_code not in (200, 204):
+            raise RuntimeError(f"{name} returned {response.status_code}: {response.data[:300]!r}")
+        return response
+
+
+def make_app(catalogue, clientside_basket):
+    """Build a Dash app with the POS layout and callbacks, as app.py does."""
+    from dash import Dash
+    import dash_bootstrap_components as dbc
+    from callbacks import register_callbacks
+    from layout import get_layout
+
+    app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True,
+               assets_folder=os.path.join(ROOT, "assets"))
+
+    def serve_layout():
+        snapshot = catalogue.current()
+        return get_layout(snapshot.products, catalogue_version=snapshot.version)
+
+    app.layout = serve_layout
+    register_callbacks(app, catalogue, clientside_basket=clientside_basket)
+    return app
+
+
+def run_size(size, sales, repeat, seed):
+    """Build a database of size products and sales lines and run every case against it."""
+    import layout
+    import reports
+    from catalogue import CatalogueStore, ProductIndex
+    from layout_cache import LayoutCache, initial_layout_key
+    from product_table import ProductTable
+    from search import SearchIndex
+
+    rng = random.Random(seed)
+    results = []
+
+    def record(case, fn, setup=None, runs=repeat):
+        result = {"case": case, "products": size, "sales": sales}
+        result.update(measure(fn, runs, setup))
+        results.append(result)
+        print(f"  {case:<32} median {result['median_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms  "
+              f"sql {result['sql_statements']:6.0f}  peak {result['alloc_peak_kb']:9.0f} KiB", flush=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        db.DB_FILE = os.path.join(tmp, "bench.db")
+        db.init_db()
+        csv_path = os.path.join(tmp, "catalogue.csv")
+        write_catalogue_csv(csv_path, size, rng)
+
+        def import_csv():
+            with contextlib.redirect_stdout(io.StringIO()):  # one report line per import
+                db.import_products_from_csv(csv_path)
+
+        def clear_products():
+            with db.get_db_connection() as conn:
+                conn.execute("DELETE FROM products")
+
+        record("import_products_from_csv:new", import_csv, setup=clear_products, runs=3)
+        import_csv()
+        record("import_products_from_csv:unchanged", import_csv)
+
+        with db.get_db_connection() as conn:
+            product_ids = [row[0] for row in conn.execute("SELECT id FROM products ORDER BY id")]
+        start = time.perf_counter()
+        load_sales(product_ids, sales, rng)
+        print(f"  loaded {sales} sales lines in {time.perf_counter() - start:.1f}s", flush=True)
+
+        catalogue = CatalogueStore()
+        products = catalogue.current().products
+        categories = [category for category in products if category != "Home"]
+        category = categories[0]
+
+        record("get_products", db.get_products)
+        record("get_popular_products:cold", db.get_popular_products, setup=db.popular_cache.invalidate)
+        record("get_popular_products:cached", db.get_popular_products)
+
+        basket_rng = random.Random(seed)
+        record("record_order", lambda: db.record_order(
+            [(basket_rng.choice(product_ids), 1, 250) for _ in range(LINES_PER_ORDER)]))
+
+        def clear_rollups():
+            with db.get_db_connection() as conn:
+                for table in ("report_product_daily", "report_product_monthly", "report_hourly",
+                              "report_watermarks"):
+                    conn.execute(f"DELETE FROM {table}")
+
+        period_start = date.today() - timedelta(days=SALES_DAYS - 1)
+        record("reports.refresh_rollups:backfill", reports.refresh_rollups, setup=clear_rollups, runs=3)
+        record("reports.z_report", reports.z_report)
+        record("reports.period_summary", lambda: reports.period_summary(period_start, date.today()))
+
+        app = make_app(catalogue, clientside_basket=True)
+        client = CallbackClient(app)
+        server_app = make_app(catalogue, clientside_basket=False)
+        server_client = CallbackClient(server_app)
+
+        record("layout", lambda: client.client.get("/_dash-layout"), setup=layout.grid_cache.clear)
+        print(f"  initial layout {len(client.client.get('/_dash-layout').data) / 1024:.0f} KiB", flush=True)
+
+        # The serialized initial page, as app.py serves it: built, read back from
+        # disk after a restart (new snapshot, empty memory) and from memory
+        layout_dir = os.path.join(tmp, "layout_cache")
+        layout_caches = []
+
+        def restart(clear_disk=False):
+            if clear_disk:
+                shutil.rmtree(layout_dir, ignore_errors=True)
+            layout.grid_cache.clear()
+            catalogue.reload()
+            layout_caches[:] = [LayoutCache(layout_dir)]
+
+        def cached_layout():
+            snapshot = catalogue.current()
+            layout_caches[0].get(initial_layout_key(snapshot), lambda: layout.get_layout(
+                snapshot.products, catalogue_version=snapshot.version))
+        record("layout_cache:build", cached_layout, setup=lambda: restart(clear_disk=True))
+        record("layout_cache:disk", cached_layout, setup=restart)
+        record("layout_cache:memory", cached_layout)
+
+        snapshot = catalogue.current()
+        record("search.build", lambda: SearchIndex(snapshot.index), runs=3)
+        search_index = snapshot.search
+        # The catalogue after renaming one product
+        edited_rows = ((c, "Renamed product" if (c, i) == (category, 0) else name, price, sku, stock, prod_id, event)
+                       for c in categories
+                       for i, (name, price, sku, stock, prod_id, event) in enumerate(snapshot.products[c]))
+        edited_index = ProductIndex(ProductTable.from_rows(edited_rows))
+        record("search.updated:one_edit", lambda: search_index.updated(edited_index), runs=3)
+        for query in ("product 0001", f"sku{size // 2:06d}", "category 01 product", "categroy 02"):
+            record(f"search.query:{query}", lambda query=query: search_index.search(query))
+        record("search_products", lambda: client.call(
+            "search_products", {"id": "search-results", "property": "children"},
+            [{"id": "product-search", "property": "value", "value": "product 00"}],
+            [{"id": "price-list", "property": "data", "value": None}]))
+
+        tab_outputs = [[{"id": {"type": "category-content", "category": c}, "property": "children"}
+                        for c in categories],
+                       {"id": "rendered-tabs", "property": "data"}]
+
+        def select_tab():
+            client.call("render_selected_tab", tab_outputs,
+                        [{"id": "category-tabs", "property": "value", "value": category}],
+                        [{"id": "rendered-tabs", "property": "data", "value": ["Home"]},
+                         {"id": "price-list", "property": "data", "value": None}])
+        record("render_selected_tab:cold", select_tab, setup=layout.grid_cache.clear)
+        record("render_selected_tab:cached", select_tab)
+
+        more_id = {"type": "load-more", "category": category}
+        record("load_more_products", lambda: client.call(
+            "load_more_products",
+            [{"id": {"type": "category-grid", "category": category}, "property": "children"},
+             {"id": more_id, "property": "children"},
+             {"id": more_id, "property": "style"},
+             {"id": more_id, "property": "disabled"}],
+            [{"id": more_id, "property": "n_clicks", "value": 1}],
+            [{"id": "price-list", "property": "data", "value": None}],
+            changed=[json.dumps(more_id, separators=(",", ":"), sort_keys=True) + ".n_clicks"]),
+            setup=layout.grid_cache.clear)
+
+        label_outputs = [{"id": {"type": "price-label", "category": c, "product_id": row[4]}, "property": "children"}
+                         for c in ["Home", category] for row in products[c]]
+        record("update_price_labels", lambda: client.call(
+            "update_price_labels", label_outputs,
+            [{"id": "effective-price-list", "property": "data", "value": db.EVENT_PRICE_LIST}]))
+
+        # A named list with a markup and an override on every tenth product
+        price_list_id = db.add_price_list("Members", markup_percent=-5)
+        with db.get_db_connection() as conn:
+            conn.executemany("INSERT INTO price_list_items (price_list_id, product_id, price_pence) VALUES (?, ?, 199)",
+                             [(price_list_id, prod_id) for prod_id in product_ids[::10]])
+        db.check_catalogue_changed()
+        record("update_price_labels:price_list", lambda: client.call(
+            "update_price_labels", label_outputs,
+            [{"id": "effective-price-list", "property": "data", "value": price_list_id}]))
+
+        record("update_popular_products", lambda: client.call(
+            "update_popular_products", {"id": "popular-products-container", "property": "children"},
+            [{"id": "refresh-trigger", "property": "data", "value": 1},
+             {"id": "catalogue-version", "property": "data", "value": None}],
+            [{"id": "price-list", "property": "data", "value": None}]),
+            setup=db.popular_cache.invalidate)
+
+        snapshot = catalogue.current()
+        page_state = layout.catalogue_state(snapshot.products, snapshot.version)
+        record("sync_catalogue:unchanged", lambda: client.call(
+            "sync_catalogue",
+            [{"id": "catalogue-version", "property": "data"},
+             {"id": "category-tabs", "property": "children"},
+             {"id": "category-tabs", "property": "value"},
+             [{"id": {"type": "category-content", "category": c}, "property": "children"} for c in categories],
+             {"id": "rendered-tabs", "property": "data"},
+             {"id": "price-list-select", "property": "options"},
+             {"id": "effective-price-list", "property": "data"}],
+            [{"id": "catalogue-poll", "property": "n_intervals", "value": 1}],
+            [{"id": "catalogue-version", "property": "data", "value": page_state},
+             {"id": "category-tabs", "property": "value", "value": category},
+             {"id": "price-list", "property": "data", "value": None},
+             {"id": "effective-price-list", "property": "data", "value": None},
+             {"id": "price-list-select", "property": "options", "value": layout.price_list_options()}]))
+
+        basket = [{"product_id": row[4], "category": category, "name": row[0], "price": row[1],
+                   "sku": row[2], "count": 1} for row in products[category][:LINES_PER_ORDER]]
+        order_outputs = [{"id": "order-store", "property": "data"},
+                         {"id": "refresh-trigger", "property": "data"},
+                         {"id": "order-message", "property": "children"}]
+        record("place_order", lambda: client.call(
+            "place_order", order_outputs,
+            [{"id": "pay-button", "property": "n_clicks", "value": 1}],
+            [{"id": "order-store", "property": "data", "value": basket},
+             {"id": "refresh-trigger", "property": "data", "value": 0}]))
+
+        tap_rng = random.Random(seed)
+        record("update_order:product_tap", lambda: server_client.call(
+            "update_order", order_outputs,
+            [{"id": "product-tap", "property": "data",
+              "value": {"product_id": tap_rng.choice(product_ids), "seq": 1}},
+             {"id": "pay-button", "property": "n_clicks", "value": None},
+             {"id": "remove-tap", "property": "data", "value": None},
+             {"id": "effective-price-list", "property": "data", "value": None}],
+            [{"id": "order-store", "property": "data", "value": basket},
+             {"id": "refresh-trigger", "property": "data", "value": 0}]))
+
+        # Three scans queued while the previous callback was still running
+        scan_skus = [row[2] for row in products[category][:3]]
+        record("add_scanned_items", lambda: server_client.call(
+            "add_scanned_items",
+            [{"id": "order-store", "property": "data"},
+             {"id": "scan-applied", "property": "data"},
+             {"id": "scan-message", "property": "children"}],
+            [{"id": "scan-queue", "property": "data",
+              "value": [[seq, sku] for seq, sku in enumerate(scan_skus, start=1)]}],
+            [{"id": "scan-applied", "property": "data", "value": 0},
+             {"id": "order-store", "property": "data", "value": basket},
+             {"id": "effective-price-list", "property": "data", "value": None}]))
+        record("look_up_scans", lambda: client.call(
+            "look_up_scans", {"id": "scan-products", "property": "data"},
+            [{"id": "scan-queue", "property": "data",
+              "value": [[seq, sku] for seq, sku in enumerate(scan_skus, start=1)]}],
+            [{"id": "scan-applied", "property": "data", "value": 0}]))
+
+        db.close_pool()
+        os.chdir(ROOT)
+    return results
+
+
+def _run_size_worker(args, queue):
+    queue.put(run_size(*args))
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, baseline_path):
+    """Print each case's median against the same case in an earlier results file."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["case"], r["products"], r["sales"]): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path} (median ms, ratio > 1 is slower):")
+    for result in results:
+        old = baseline.get((result["case"], result["products"], result["sales"]))
+        if old is None:
+            continue
+        ratio = result["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+        flag = "  <-- slower" if ratio > 1.2 else ""
+        print(f"  {result['products']:>6} {result['case']:<32} {old['median_ms']:9.2f} -> "
+              f"{result['median_ms']:9.2f}  x{ratio:.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000,50000", help="comma-separated catalogue sizes")
+    parser.add_argument("--sales", type=int, default=100000, help="sales lines in the log (up to 10M)")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per case")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    results = []
+    # Each size runs in a fresh interpreter so caches and listeners never leak between them
+    context = multiprocessing.get_context("spawn")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        print(f"{size} products, {args.sales} sales lines", flush=True)
+        queue = context.Queue()
+        process = context.Process(target=_run_size_worker, args=((size, args.sales, args.repeat, args.seed), queue))
+        process.start()
+        while True:
+            try:
+                results.extend(queue.get(timeout=1))
+                break
+            except queue_module.Empty:
+                if not process.is_alive():
+                    sys.exit(f"benchmark for {size} products failed (exit code {process.exitcode})")
+        process.join()
+
+    report = {"environment": environment(), "settings": vars(args), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Write-behind check: "Place Order" must not wait for the database.
+
+Queues checkouts through sale_writer.SaleWriter while a second connection
+holds the SQLite write lock, as a long report or another till would, and
+checks that each submit() still returns in about the time of a journal
+fsync. Once the lock is released every checkout must be recorded exactly
+once, with the stock check still refusing what the stock does not cover.
+
+    python benchmarks/write_behind.py --orders 20 --hold 2
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import sale_writer
+
+
+def setup(db_file, stock):
+    """Create a fresh database with one product."""
+    db.DB_FILE = db_file
+    db.init_db()
+    with db.get_db_connection() as conn:
+        conn.execute("INSERT INTO categories (name) VALUES ('Bench')")
+        conn.execute("INSERT INTO products (category_id, name, price_pence, event_price_pence, sku, stock) "
+                     "VALUES (1, 'Product', 250, 275, 'B00001', ?)", (stock,))
+        return conn.execute("SELECT id FROM products").fetchone()[0]
+
+
+def time_submits(writer, product_id, orders):
+    """Submit single-item checkouts; returns each submit's latency in ms."""
+    latencies = []
+    for _ in range(orders):
+        start = time.perf_counter()
+        writer.submit([(product_id, 1, 250)])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=20, help="checkouts per phase")
+    parser.add_argument("--hold", type=float, default=2.0, help="seconds the write lock is held")
+    parser.add_argument("--max-ms", type=float, default=200.0, help="slowest submit allowed while locked")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stock = 3 * args.orders
+        product_id = setup(os.path.join(tmp, "bench.db"), stock)
+        writer = sale_writer.SaleWriter(os.path.join(tmp, "sales.journal")).start()
+
+        free = time_submits(writer, product_id, args.orders)
+        writer.flush(10)
+
+        # Another connection takes the write lock; the writer thread blocks on its first batch
+        blocker = sqlite3.connect(db.DB_FILE, isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        locked_start = time.perf_counter()
+        locked = time_submits(writer, product_id, args.orders)
+        # Only what is left after both phases may be queued on top
+        try:
+            writer.submit([(product_id, stock - 2 * args.orders + 1, 250)])
+            oversold = True
+        except db.OutOfStockError:
+            oversold = False
+        time.sleep(max(0.0, args.hold - (time.perf_counter() - locked_start)))
+        blocker.rollback()
+        blocker.close()
+
+        flushed = writer.flush(30)
+        writer.stop()
+        with db.get_db_connection() as conn:
+            recorded = conn.execute("SELECT COUNT(*), COUNT(DISTINCT client_ref) FROM orders").fetchone()
+            left = conn.execute("SELECT stock FROM products WHERE id = ?", (product_id,)).fetchone()[0]
+        db.close_pool()
+
+    expected = 2 * args.orders
+    print(f"orders/phase={args.orders} write lock held {args.hold:.1f}s")
+    print(f"submit, database free:   median {statistics.median(free):7.2f} ms  max {max(free):7.2f} ms")
+    print(f"submit, database locked: median {statistics.median(locked):7.2f} ms  max {max(locked):7.2f} ms")
+    print(f"recorded: {recorded[0]} (distinct refs {recorded[1]}) expected {expected}  stock left: {left}")
+    ok = (max(locked) <= args.max_ms and flushed and not oversold
+          and recorded[0] == recorded[1] == expected and left == stock - expected)
+    print("submit did not wait for the database" if ok else "WRITE-BEHIND CHECK FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
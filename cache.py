@@ -0,0 +1,85 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """A small thread-safe cache whose entries expire after ``ttl`` seconds.
+
+    An entry stored with a version is only returned to a get() asking for
+    the same version; any other version counts as a miss.
+    """
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None, version=None):
+        """Return the cached value for key, or default if missing, expired or of another version."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl and entry[2] == version:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, version=None):
+        """Store value under key, restarting its time to live."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value, version)
+
+    def invalidate(self, key=None):
+        """Drop one entry, or every entry when no key is given."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        """Return hit/miss counters and the current number of entries."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "ttl": self.ttl}
+
+
+class LRUCache:
+    """A thread-safe mapping that evicts the least recently used entry beyond ``maxsize``."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key and mark it recently used."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """Store value under key, evicting the oldest entries if full."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters and the current number of entries."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
@@ -1,179 +1,479 @@
-import json
-from dash import callback_context, dcc, no_update, html
+from dash import callback_context, no_update, html, ClientsideFunction, Patch
 from dash.dependencies import Input, Output, State, ALL, MATCH
 import dash_bootstrap_components as dbc
-from layout import create_product_button_content, popular_product_buttons, get_home_content, get_category_content
-from db import record_product_sale, get_products
+from layout import (format_price, popular_product_buttons, product_buttons, category_tabs, basket_product,
+                    catalogue_state, price_list_options, price_list_pricing,
+                    search_result_buttons, product_page, load_more_text, load_more_style,
+                    GRID_PAGE_SIZE)
+from db import record_order, OutOfStockError, EVENT_PRICE_LIST, effective_price_list, product_price
+from money import format_pence
 
 
-def register_callbacks(app, products):
-    # Event pricing toggle callback
+def register_callbacks(app, catalogue, clientside_basket=False, till_sync=None, sale_writer=None):
+    """Register the POS callbacks; they read products from catalogue.current() on every call.
+
+    With till_sync (a till_sync.SyncClient) every recorded checkout is also
+    queued for the multi-till sync server. With sale_writer (a
+    sale_writer.SaleWriter) checkouts are journaled and written to the
+    database in the background instead of before "Place Order" returns.
+    """
+
+    def till_items(current_order):
+        """Return the basket lines with the category the sync server finds each product by"""
+        index = catalogue.current().index
+        items = []
+        for item in current_order:
+            product = index.get(item["product_id"])
+            items.append(dict(item, category=product.category) if product else item)
+        return items
+
+    def checkout(current_order):
+        """Record the whole basket as one order; returns an alert if it was rejected"""
+        lines = [(item["product_id"], item.get("count", 1), item["price"]) for item in current_order]
+        try:
+            if sale_writer is not None:
+                # Stock is checked against the database less the checkouts still queued
+                sale_writer.submit(lines)
+                if till_sync is not None:
+                    till_sync.submit(till_items(current_order))
+                return None
+            order_id = record_order(lines)
+        except OutOfStockError as e:
+            names = [item["name"] for item in current_order if item["product_id"] in e.product_ids]
+            return dbc.Alert(f"Not enough stock for: {', '.join(names)}. Order not placed.",
+                             color="warning", dismissable=True)
+        if order_id is None:
+            return dbc.Alert("The order could not be saved. Please try again.",
+                             color="danger", dismissable=True)
+        if till_sync is not None:
+            till_sync.submit(till_items(current_order))
+        return None
+
+    # Price list selection: the Event button toggles event pricing, the
+    # dropdown picks a named price list; choosing one turns the other off
     @app.callback(
-        [Output("event-pricing-active", "data"),
+        [Output("price-list", "data"),
          Output("event-pricing-button", "color"),
-         Output("event-pricing-button", "style")],
-        Input("event-pricing-button", "n_clicks"),
-        [State("event-pricing-active", "data"),
-         State("event-pricing-button", "style")],
+         Output("event-pricing-button", "style"),
+         Output("price-list-select", "value"),
+         Output("effective-price-list", "data")],
+        [Input("event-pricing-button", "n_clicks"),
+         Input("price-list-select", "value")],
+        [State("price-list", "data"),
+         State("event-pricing-button", "style"),
+         State("effective-price-list", "data")],
         prevent_initial_call=True
     )
-    def toggle_event_pricing(n_clicks, current_state, current_style):
-        if n_clicks is None:
-            return current_state, "secondary", current_style
-        
-        # Toggle the pricing state
-        new_state = not current_state
-        
+    def select_price_list(n_clicks, selected_list, current_list, current_style, current_effective):
+        triggered = callback_context.triggered[0]["prop_id"] if callback_context.triggered else ""
+        if triggered.startswith("event-pricing-button"):
+            new_list = None if current_list == EVENT_PRICE_LIST else EVENT_PRICE_LIST
+            dropdown_value = None
+        else:
+            new_list = selected_list
+            dropdown_value = no_update
+        if new_list == current_list:
+            return no_update, no_update, no_update, dropdown_value, no_update
+        new_effective = effective_price_list(new_list)
+        if new_list is not None and new_effective is None:
+            # Outside its window (the page's options may be out of date): stay on the current list
+            dropdown_value = None if current_list == EVENT_PRICE_LIST else current_list
+            return no_update, no_update, no_update, dropdown_value, no_update
+
         # Update button style with the right color
         magenta_color = "#e83e8c"
         gray_color = "#6c757d"
-        
+        event_active = new_list == EVENT_PRICE_LIST
+
         new_style = current_style.copy() if current_style else {"width": "120px"}
-        new_style["backgroundColor"] = magenta_color if new_state else gray_color
-        new_style["borderColor"] = magenta_color if new_state else gray_color
-        
+        new_style["backgroundColor"] = magenta_color if event_active else gray_color
+        new_style["borderColor"] = magenta_color if event_active else gray_color
+
+        effective = new_effective if new_effective != current_effective else no_update
+
         # Return magenta color for active state, gray for inactive
-        return new_state, magenta_color if new_state else "secondary", new_style
-    
-    # Generate callbacks for each tab to update content when event pricing changes
+        return new_list, magenta_color if event_active else "secondary", new_style, dropdown_value, effective
+
     @app.callback(
-        Output("category-tabs", "children"),
-        [Input("event-pricing-active", "data"),
-         Input("refresh-trigger", "data")],
+        [Output({"type": "category-content", "category": ALL}, "children"),
+         Output("rendered-tabs", "data")],
+        Input("category-tabs", "value"),
+        [State("rendered-tabs", "data"),
+         State("price-list", "data")],
         prevent_initial_call=True
     )
-    def update_all_tabs(event_pricing_active, refresh_trigger):
-        """Update all tabs with the current event pricing state"""
-        # Create tabs with the current event pricing
-        category_contents = {
-            "Home": get_home_content(products, event_pricing_active)
-        }
-        
-        # Add content for other categories
-        for category in products.keys():
-            if category != "Home":
-                category_contents[category] = get_category_content(
-                    products, category, event_pricing_active
-                )
-        
-        # Create tabs
-        tabs = []
-        for category, content in category_contents.items():
-            tabs.append(dcc.Tab(label=category, value=category, children=content))
-            
-        return tabs
+    def render_selected_tab(selected, rendered_tabs, price_list):
+        """Render a category's grid the first time its tab is selected"""
+        products = catalogue.current().products
+        outputs = callback_context.outputs_list[0]
+        if selected in rendered_tabs or selected not in products:
+            return [no_update] * len(outputs), no_update
 
-    def get_product_price(category, name, event_pricing_active):
-        """Helper function to get product price with event pricing adjustment"""
-        for prod_name, price, sku, stock, prod_id in products[category]:
-            if prod_name == name:
-                return price * 1.1 if event_pricing_active else price
-        return None
+        price_list = effective_price_list(price_list)
+        contents = [
+            product_buttons(products, selected, price_list)
+            if output["id"]["category"] == selected else no_update
+            for output in outputs
+        ]
+        return contents, rendered_tabs + [selected]
+
+    # The browser disables "Show more" as soon as it is pressed, so pages are
+    # requested one at a time and n_clicks is always the next page to send
+    app.clientside_callback(
+        "function (n_clicks) { return true; }",
+        Output({"type": "load-more", "category": MATCH}, "disabled"),
+        Input({"type": "load-more", "category": MATCH}, "n_clicks"),
+        prevent_initial_call=True
+    )
+
+    @app.callback(
+        [Output({"type": "category-grid", "category": MATCH}, "children"),
+         Output({"type": "load-more", "category": MATCH}, "children"),
+         Output({"type": "load-more", "category": MATCH}, "style"),
+         Output({"type": "load-more", "category": MATCH}, "disabled", allow_duplicate=True)],
+        Input({"type": "load-more", "category": MATCH}, "n_clicks"),
+        State("price-list", "data"),
+        prevent_initial_call=True
+    )
+    def load_more_products(n_clicks, price_list):
+        """Append the next page of rows to a category grid"""
+        category = callback_context.triggered_id["category"]
+        products = catalogue.current().products
+        if not n_clicks or category not in products:
+            return no_update, no_update, no_update, False
+
+        total = len(products[category])
+        grid = Patch()
+        grid.extend(product_page(products, category, n_clicks, effective_price_list(price_list)))
+        shown = min(total, (n_clicks + 1) * GRID_PAGE_SIZE)
+        return grid, load_more_text(shown, total), load_more_style(shown, total), False
+
+    @app.callback(
+        Output({"type": "price-label", "category": ALL, "product_id": ALL}, "children"),
+        Input("effective-price-list", "data"),
+        prevent_initial_call=True
+    )
+    def update_price_labels(price_list):
+        """Update only the price text of rendered buttons when the prices being charged change"""
+        index = catalogue.current().index
+        labels = []
+        for output in callback_context.outputs_list:
+            product = index.get(output["id"]["product_id"])
+            labels.append(format_price(product.id, product.price, product.event_price, price_list)
+                          if product else no_update)
+        return labels
+
+    @app.callback(
+        Output("search-results", "children"),
+        Input("product-search", "value"),
+        State("price-list", "data"),
+        prevent_initial_call=True
+    )
+    def search_products(query, price_list):
+        """Show the best matches for the search box as product buttons"""
+        if not query or not query.strip():
+            return None
+        results = catalogue.current().search.search(query)
+        return search_result_buttons(results, effective_price_list(price_list))
+
+    @app.callback(
+        Output("popular-products-container", "children"),
+        [Input("refresh-trigger", "data"),
+         Input("catalogue-version", "data")],
+        State("price-list", "data"),
+        prevent_initial_call=True
+    )
+    def update_popular_products(refresh_trigger, catalogue_version, price_list):
+        """Rebuild only the Most Popular grid after a sale or catalogue change"""
+        return popular_product_buttons(catalogue.current().products, refresh_trigger,
+                                       effective_price_list(price_list))
+
+    @app.callback(
+        [Output("catalogue-version", "data"),
+         Output("category-tabs", "children"),
+         Output("category-tabs", "value"),
+         Output({"type": "category-content", "category": ALL}, "children", allow_duplicate=True),
+         Output("rendered-tabs", "data", allow_duplicate=True),
+         Output("price-list-select", "options"),
+         Output("effective-price-list", "data", allow_duplicate=True)],
+        Input("catalogue-poll", "n_intervals"),
+        [State("catalogue-version", "data"),
+         State("category-tabs", "value"),
+         State("price-list", "data"),
+         State("effective-price-list", "data"),
+         State("price-list-select", "options")],
+        prevent_initial_call=True
+    )
+    def sync_catalogue(n_intervals, page_catalogue, selected, price_list, page_effective, page_options):
+        """Bring an open page up to date when the catalogue snapshot or the prices being charged change"""
+        snapshot = catalogue.current()
+        outputs = callback_context.outputs_list[3]
+        # A price list's activation window can open or close with no catalogue change,
+        # which changes both the prices charged and which lists can be picked
+        price_list = effective_price_list(price_list)
+        effective = price_list if price_list != page_effective else no_update
+        options = price_list_options()
+        options = options if options != page_options else no_update
+        if page_catalogue and page_catalogue["version"] == snapshot.version:
+            return no_update, no_update, no_update, [no_update] * len(outputs), no_update, options, effective
+
+        products = snapshot.products
+        new_state = catalogue_state(products, snapshot.version)
+        if not page_catalogue or page_catalogue["categories"] != new_state["categories"]:
+            # Categories were added or removed, so the tab list itself is rebuilt;
+            # if the selected one has gone the page moves back to Home
+            if selected not in products:
+                tabs = category_tabs(products, price_list)
+                return new_state, tabs, "Home", [no_update] * len(outputs), ["Home"], options, effective
+            tabs = category_tabs(products, price_list, selected)
+            return new_state, tabs, no_update, [no_update] * len(outputs), ["Home", selected], options, effective
+
+        # Same tabs: re-render the visible category and let the others render on demand
+        contents = [
+            product_buttons(products, selected, price_list)
+            if output["id"]["category"] == selected else None
+            for output in outputs
+        ]
+        return new_state, no_update, no_update, contents, ["Home", selected], options, effective
+
+    def get_product_price(prod_id, price_list):
+        """Return a product's price in pence on the given (already effective) price list"""
+        product = catalogue.current().index.get(prod_id)
+        if product is None:
+            return None
+        return product_price(product.id, product.price, product.event_price, price_list)
+
+    def add_product(order, product, price_list):
+        """Add one of product to the order lines in place, up to its stock level"""
+        for item in order:
+            if item["product_id"] == product.id:
+                if item["count"] < product.stock:  # Check stock level
+                    item["count"] += 1
+                return
+        if product.stock > 0:  # Only add if stock available
+            order.append({
+                "product_id": product.id,
+                "category": product.category,
+                "name": product.name,
+                "price": get_product_price(product.id, price_list),
+                "sku": product.sku,
+                "count": 1
+            })
+
+    # Taps are reduced to a single small event in the browser, so the basket
+    # callbacks never receive the n_clicks of every button in the catalogue;
+    # the event carries the tapped button's product details (its value)
+    app.clientside_callback(
+        ClientsideFunction(namespace="basket", function_name="productTap"),
+        Output("product-tap", "data"),
+        Input({"type": "product-button", "category": ALL, "product_id": ALL}, "n_clicks"),
+        State({"type": "product-button", "category": ALL, "product_id": ALL}, "value"),
+        prevent_initial_call=True,
+    )
+
+    app.clientside_callback(
+        ClientsideFunction(namespace="basket", function_name="removeTap"),
+        Output("remove-tap", "data"),
+        Input({"type": "remove-button", "index": ALL}, "n_clicks"),
+        prevent_initial_call=True,
+    )
+
+    # Let assets/scanner.js forget scans once they are in the order
+    app.clientside_callback(
+        ClientsideFunction(namespace="scanner", function_name="acknowledge"),
+        Input("scan-applied", "data"),
+        prevent_initial_call=True,
+    )
+
+    if clientside_basket:
+        @app.callback(
+            Output("price-list-prices", "data"),
+            [Input("effective-price-list", "data"),
+             Input("catalogue-version", "data")],  # markup and override edits bump it
+            State("price-list-prices", "data"),
+            prevent_initial_call=True,
+        )
+        def update_price_list_prices(price_list, catalogue_version, current_prices):
+            """Send the browser the markup and overrides it needs to price the basket"""
+            prices = price_list_pricing(price_list)
+            return prices if prices != current_prices else no_update
+
+        # Basket add/remove and the order summary run in the browser (assets/basket.js)
+        app.clientside_callback(
+            ClientsideFunction(namespace="basket", function_name="updateOrder"),
+            Output("order-store", "data"),
+            [Input("product-tap", "data"),
+             Input("remove-tap", "data"),
+             Input("price-list-prices", "data")],
+            State("order-store", "data"),
+            prevent_initial_call=True,
+        )
+
+        # The page holds no catalogue, so scanned SKUs are looked up here in memory
+        @app.callback(
+            Output("scan-products", "data"),
+            Input("scan-queue", "data"),
+            State("scan-applied", "data"),
+            prevent_initial_call=True,
+        )
+        def look_up_scans(scan_queue, applied):
+            """Send the browser the scans it has not applied yet with each SKU's product details"""
+            new_scans = [[seq, sku] for seq, sku in scan_queue or [] if seq > (applied or 0)]
+            if not new_scans:
+                return no_update
+            index = catalogue.current().index
+            products = {}
+            for _, sku in new_scans:
+                product = index.find_sku(sku)
+                products[sku] = None if product is None else dict(
+                    basket_product(product.name, product.price, product.sku, product.stock, product.event_price),
+                    id=product.id)
+            return {"scans": new_scans, "products": products}
+
+        # Scanned barcodes skip the product-tap path and go straight into the order
+        app.clientside_callback(
+            ClientsideFunction(namespace="basket", function_name="addScans"),
+            [Output("order-store", "data", allow_duplicate=True),
+             Output("scan-applied", "data"),
+             Output("scan-message", "children")],
+            Input("scan-products", "data"),
+            [State("scan-applied", "data"),
+             State("order-store", "data"),
+             State("price-list-prices", "data")],
+            prevent_initial_call=True,
+        )
+
+        app.clientside_callback(
+            ClientsideFunction(namespace="basket", function_name="renderOrder"),
+            [Output("order-list", "children"),
+             Output("order-total", "children"),
+             Output("order-total-top", "children")],
+            Input("order-store", "data"),
+        )
+
+        @app.callback(
+            [Output("order-store", "data", allow_duplicate=True),
+             Output("refresh-trigger", "data"),
+             Output("order-message", "children")],
+            Input("pay-button", "n_clicks"),
+            [State("order-store", "data"),
+             State("refresh-trigger", "data")],
+            prevent_initial_call=True,
+        )
+        def place_order(pay_n_clicks, current_order, refresh_trigger):
+            if not current_order:
+                return no_update, no_update, None
+            rejected = checkout(current_order)
+            if rejected:
+                # Keep the basket so staff can adjust it
+                return no_update, no_update, rejected
+            # Clear the order and trigger a refresh of popular products
+            return [], refresh_trigger + 1, None
+
+        # The server-side basket callbacks below are not needed in this mode
+        return
 
     @app.callback(
         [Output("order-store", "data"),
-         Output("refresh-trigger", "data")],
-        [Input({
-            "type": "product-button", 
-            "category": ALL, 
-            "name": ALL
-        }, "n_clicks"),
+         Output("refresh-trigger", "data"),
+         Output("order-message", "children")],
+        [Input("product-tap", "data"),
          Input("pay-button", "n_clicks"),
-         Input({
-             "type": "remove-button", 
-             "index": ALL
-         }, "n_clicks"),
-         Input("event-pricing-active", "data")],
+         Input("remove-tap", "data"),
+         Input("effective-price-list", "data")],
         [State("order-store", "data"),
          State("refresh-trigger", "data")],
         prevent_initial_call=True,
     )
-    def update_order(prod_n_clicks, pay_n_clicks, remove_n_clicks, event_pricing_active, current_order, refresh_trigger):
+    def update_order(product_tap, pay_n_clicks, remove_tap, price_list, current_order, refresh_trigger):
         ctx = callback_context
         if not ctx.triggered:
-            return current_order, refresh_trigger
+            return current_order, refresh_trigger, no_update
 
         triggered_prop = ctx.triggered[0]["prop_id"]
         triggered_id_str = triggered_prop.split(".")[0]
 
-        # If event pricing state changed, only update prices in the current order
-        if triggered_id_str == "event-pricing-active":
+        price_list = effective_price_list(price_list)
+
+        # If the prices being charged changed (a switch, or a window opening or
+        # closing), only update prices in the current order; the button labels
+        # are updated separately by update_price_labels
+        if triggered_id_str == "effective-price-list":
             if not current_order:
-                return current_order, refresh_trigger
+                return current_order, refresh_trigger, no_update
             updated_order = []
             for item in current_order:
-                new_price = get_product_price(item["category"], item["name"], event_pricing_active)
+                new_price = get_product_price(item["product_id"], price_list)
                 updated_item = item.copy()
                 updated_item["price"] = new_price
                 updated_order.append(updated_item)
-            return updated_order, refresh_trigger + 1  # Trigger refresh
+            return updated_order, refresh_trigger, no_update
 
         if triggered_id_str == "pay-button":
-            # Record sales before clearing the order
-            for item in current_order:
-                # Find product ID based on category and name
-                for prod_name, price, sku, stock, prod_id in products[item["category"]]:
-                    if prod_name == item["name"]:
-                        # Record the sale with quantity
-                        record_product_sale(prod_id, item.get("count", 1))
-                        break
+            # Record the whole basket as one order before clearing it
+            rejected = checkout(current_order)
+            if rejected:
+                # Keep the basket so staff can adjust it
+                return current_order, refresh_trigger, rejected
             
             # Increment refresh trigger to update popular products
-            return [], refresh_trigger + 1  # Clear order and trigger refresh
+            return [], refresh_trigger + 1, None  # Clear order and trigger refresh
 
-        try:
-            btn_id = json.loads(triggered_id_str)
-        except Exception as e:
-            print("Error parsing triggered id:", e)
-            return current_order, refresh_trigger
-
-        btn_type = btn_id.get("type", None)
         updated_order = current_order.copy()
 
-        if btn_type == "product-button":
-            cat = btn_id["category"]
-            name = btn_id["name"].replace('_', '.')  # Convert underscores back to dots
-
-            # Look up the product details from the database results
-            product_info = None
-            for prod_name, price, sku, stock, prod_id in products[cat]:
-                if prod_name == name:
-                    # Apply event pricing if active
-                    adjusted_price = price * 1.1 if event_pricing_active else price
-                    product_info = {"name": name, "price": adjusted_price, "sku": sku, "stock": stock}
-                    break
-
-            if not product_info:
-                return updated_order, refresh_trigger
-
-            # Check for duplicates and update the count
-            found = False
-            for item in updated_order:
-                if item["name"] == name:
-                    if item["count"] < product_info["stock"]:  # Check stock level
-                        item["count"] += 1
-                    found = True
-                    break
-            if not found and product_info["stock"] > 0:  # Only add if stock available
-                updated_order.append({
-                    "category": cat,
-                    "name": name,
-                    "price": product_info["price"],
-                    "sku": product_info["sku"],
-                    "count": 1
-                })
-            return updated_order, refresh_trigger
-
-        elif btn_type == "remove-button":
-            remove_index = btn_id["index"]
+        if triggered_id_str == "product-tap" and product_tap:
+            # Look up the product details by the id reported by the tap
+            product = catalogue.current().index.get(product_tap["product_id"])
+            if product is None:
+                return updated_order, refresh_trigger, no_update
+
+            # Priced on the session's price list; a repeat tap adds to the count
+            add_product(updated_order, product, price_list)
+            return updated_order, refresh_trigger, no_update
+
+        elif triggered_id_str == "remove-tap" and remove_tap:
+            remove_index = remove_tap["index"]
             if 0 <= remove_index < len(updated_order):
                 if updated_order[remove_index].get("count", 1) > 1:
                     updated_order[remove_index]["count"] -= 1
                 else:
                     del updated_order[remove_index]
-            return updated_order, refresh_trigger
+            return updated_order, refresh_trigger, no_update
+
+        return updated_order, refresh_trigger, no_update
+
+    @app.callback(
+        [Output("order-store", "data", allow_duplicate=True),
+         Output("scan-applied", "data"),
+         Output("scan-message", "children")],
+        Input("scan-queue", "data"),
+        [State("scan-applied", "data"),
+         State("order-store", "data"),
+         State("effective-price-list", "data")],
+        prevent_initial_call=True,
+    )
+    def add_scanned_items(scan_queue, applied, current_order, price_list):
+        """Add the scans newer than scan-applied to the order, looking each SKU up in memory
+
+        The queue holds every scan the page has not seen applied, so a scan is
+        never lost when callbacks overlap and never added twice.
+        """
+        new_scans = [(seq, sku) for seq, sku in scan_queue or [] if seq > (applied or 0)]
+        if not new_scans:
+            return no_update, no_update, no_update
 
-        return updated_order, refresh_trigger
+        index = catalogue.current().index
+        price_list = effective_price_list(price_list)
+        updated_order = [item.copy() for item in current_order or []]
+        unknown = []
+        for seq, sku in new_scans:
+            product = index.find_sku(sku)
+            if product is None:
+                unknown.append(sku)
+                continue
+            add_product(updated_order, product, price_list)
+        message = f"Unknown barcode: {', '.join(unknown)}" if unknown else None
+        return updated_order, new_scans[-1][0], message
 
     @app.callback(
         [Output("order-list", "children"),
@@ -205,11 +505,11 @@ def register_callbacks(app, products):
                                      style={"fontSize": "16px", "fontWeight": "bold"}),
                             html.Br(),
                             # Reduced from 16px to 13px (approximately 20% smaller)
-                            html.Span(f"£{unit_price:.2f} each", 
+                            html.Span(f"{format_pence(unit_price)} each", 
                                      style={"fontSize": "13px"}),
                             html.Br(),
                             # Reduced from 16px to 13px (approximately 20% smaller)
-                            html.Span(f"Subtotal: £{subtotal:.2f}", 
+                            html.Span(f"Subtotal: {format_pence(subtotal)}", 
                                      style={"fontSize": "13px"})
                         ]),
                         width=8,
@@ -241,7 +541,7 @@ def register_callbacks(app, products):
             item_components.append(item_row)
 
         total = sum(item["price"] * item.get("count", 1) for item in order)
-        total_text = f"Total: £{total:.2f}"
+        total_text = f"Total: {format_pence(total)}"
         
         # Return values for all three outputs: order list, bottom total, and top total
-        return item_components, total_text, total_text
\ No newline at end of file
+        return item_components, total_text, total_text
@@ -0,0 +1,153 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+import db
+from product_table import HOME
+from search import SearchIndex
+
+# Prices are integer pence; event_price is stored alongside rather than computed
+Product = namedtuple("Product", ["id", "category", "name", "price", "sku", "stock", "event_price"])
+
+
+class ProductIndex:
+    """Product lookups by id, SKU and name over the product_table.ProductTable from db.get_products().
+
+    Lookups bisect sorted arrays of row numbers rather than keeping a dict
+    entry per product; the Product for a row is built when it is asked for.
+    """
+
+    def __init__(self, products):
+        self.products = products
+        ids = products.ids
+        id_rows = sorted(range(len(ids)), key=ids.__getitem__)
+        self._id_rows = array("q", id_rows)
+        self._ids = array("q", (ids[row] for row in id_rows))
+        skus = products.skus
+        sku_rows = sorted((row for row in range(len(skus)) if skus[row]), key=skus.__getitem__)
+        self._sku_rows = array("q", sku_rows)
+        self._skus = [skus[row] for row in sku_rows]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, prod_id):
+        return self._id_row(prod_id) is not None
+
+    def __iter__(self):
+        """Yield every Product, category by category."""
+        for category in self.products:
+            if category == HOME:
+                continue
+            for name, price, sku, stock, prod_id, event_price in self.products[category]:
+                yield Product(prod_id, category, name, price, sku, stock, event_price)
+
+    def _id_row(self, prod_id):
+        if not isinstance(prod_id, int):
+            return None
+        i = bisect_left(self._ids, prod_id)
+        if i < len(self._ids) and self._ids[i] == prod_id:
+            return self._id_rows[i]
+        return None
+
+    def _product(self, row):
+        table = self.products
+        return Product(table.ids[row], table.category_at(row), table.names[row], table.prices[row],
+                       table.skus[row], table.stocks[row], table.event_prices[row])
+
+    def get(self, prod_id):
+        """Return the product with this id, or None."""
+        row = self._id_row(prod_id)
+        return None if row is None else self._product(row)
+
+    def find(self, category, name):
+        """Return the product called name in category, or None."""
+        rows = self.products.category_range(category)
+        if rows is None:
+            return None
+        row = bisect_left(self.products.names, name, *rows)
+        if row < rows[1] and self.products.names[row] == name:
+            return self._product(row)
+        return None
+
+    def find_sku(self, sku):
+        """Return the product with this SKU, or None."""
+        if not isinstance(sku, str):
+            return None
+        i = bisect_left(self._skus, sku)
+        if i < len(self._skus) and self._skus[i] == sku:
+            return self._product(self._sku_rows[i])
+        return None
+
+
+class CatalogueSnapshot:
+    """The catalogue as loaded at one version; never modified after creation.
+
+    The search index is built the first time it is used. previous_search,
+    the index of an earlier snapshot, lets it re-index only what changed.
+    """
+
+    def __init__(self, version, products, previous_search=None):
+        self.version = version
+        self.products = products
+        self.index = ProductIndex(products)
+        self._search = None
+        self._previous_search = previous_search
+        self._search_lock = threading.Lock()
+        self._checksum = None
+
+    @property
+    def search(self):
+        """The search.SearchIndex over this snapshot's products."""
+        if self._search is None:
+            with self._search_lock:
+                if self._search is None:
+                    previous, self._previous_search = self._previous_search, None
+                    self._search = previous.updated(self.index) if previous else SearchIndex(self.index)
+        return self._search
+
+    @property
+    def checksum(self):
+        """Digest of this snapshot's products (see ProductTable.checksum)."""
+        if self._checksum is None:
+            self._checksum = self.products.checksum()
+        return self._checksum
+
+    def categories(self):
+        """Return the real category names (everything except Home)."""
+        return [category for category in self.products if category != HOME]
+
+
+class CatalogueStore:
+    """Holds the current catalogue snapshot and swaps it when the database changes.
+
+    Writes made through db.py replace the snapshot straight away. Writes from
+    other processes are noticed by db.check_catalogue_changed(), which
+    current() runs at most once every check_interval seconds.
+    """
+
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._last_check = time.monotonic()
+        self._snapshot = self._load()
+        db.on_catalogue_change(self.reload)
+
+    def _load(self, previous=None):
+        previous_search = previous and (previous._search or previous._previous_search)
+        return CatalogueSnapshot(db.get_catalogue_version(), db.get_products(), previous_search)
+
+    def reload(self):
+        """Load a fresh snapshot and make it current in one reference swap."""
+        with self._lock:
+            self._snapshot = self._load(self._snapshot)
+
+    def current(self):
+        """Return the current snapshot, first checking for outside changes if due."""
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            db.check_catalogue_changed()
+        return self._snapshot
@@ -1,15 +1,290 @@
 import sqlite3
 import csv
 import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from pathlib import Path
+
+from cache import LRUCache, TTLCache
+from metrics import count_statement, timed
+from money import apply_markup, event_price, to_pence
+from product_table import ProductTable
 
 DB_FILE = "products.db"
 
+# Pragmas applied to every pooled connection when it is first opened.
+# journal_mode is persistent in the database file so it is set once in init_db().
+CONNECTION_PRAGMAS = {
+    "synchronous": "NORMAL",   # WAL + NORMAL only fsyncs at checkpoints
+    "cache_size": -16000,      # ~16MB page cache per connection
+    "mmap_size": 268435456,    # 256MB memory-mapped I/O
+    "temp_store": "MEMORY",
+}
+BUSY_TIMEOUT = 5.0
+POOL_MAX_SIZE = 8
+
+# Top-N popular products keyed by (days, limit). Each entry remembers the
+# database's data_version when it was read and is used only while that is
+# unchanged, so sales recorded by other processes or tills are seen at once;
+# the TTL only bounds clock drift of the rolling window.
+POPULAR_CACHE_TTL = 300
+popular_cache = TTLCache(ttl=POPULAR_CACHE_TTL)
+
+# A session's price list: None for standard prices, EVENT_PRICE_LIST for the
+# event price stored on each product, or the id of a row in price_lists
+EVENT_PRICE_LIST = "event"
+
+# Price list definitions and resolved {product_id: pence} maps, keyed by
+# catalogue version (price list edits bump it too), so a tier switch is one lookup
+PRICE_LIST_CACHE_SIZE = 32
+price_list_cache = LRUCache(maxsize=PRICE_LIST_CACHE_SIZE)
+
+# The catalogue version stored in the database, bumped on every product or
+# category write so rendered views can tell whether they are stale; listeners
+# are called after each bump. Every process (and worker) sharing DB_FILE sees
+# the same numbers. Writes made outside this process are picked up by
+# check_catalogue_changed().
+_catalogue_version = None
+_catalogue_listeners = []
+
+# Watcher state for check_catalogue_changed() and _data_version()
+_watch_lock = threading.Lock()
+_watch_conn = None
+_watch_key = None
+_seen_data_version = None
+_seen_db_version = None
+
+
+def get_catalogue_version():
+    """Return a counter that changes whenever products or categories are written."""
+    global _catalogue_version, _seen_db_version
+    if _catalogue_version is None:
+        with get_db_connection() as conn:
+            _catalogue_version = _seen_db_version = _read_db_catalogue_version(conn)
+    return _catalogue_version
+
+
+def on_catalogue_change(listener):
+    """Register a no-argument callable to run after the catalogue changes."""
+    _catalogue_listeners.append(listener)
+
+
+def _read_db_catalogue_version(conn):
+    """Return the catalogue version maintained by triggers in the database."""
+    row = conn.execute("SELECT version FROM catalogue_version WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+def _catalogue_changed(db_version=None):
+    """Take up the catalogue version the triggers set and notify listeners."""
+    global _catalogue_version, _seen_db_version
+    if db_version is None:
+        # Our own write, already counted by the triggers. Every catalogue edit
+        # sets a column they watch, so read the version rather than bump it
+        # again, and remember it so the watcher does not report it again
+        with get_db_connection() as conn:
+            db_version = _read_db_catalogue_version(conn)
+    _seen_db_version = db_version
+    _catalogue_version = db_version
+    popular_cache.invalidate()
+    price_list_cache.clear()
+    for listener in _catalogue_listeners:
+        listener()
+
+
+def _watch_connection():
+    """Return the watcher's own connection, reopened after a fork or DB_FILE change; hold _watch_lock."""
+    global _watch_conn, _watch_key, _seen_data_version
+    key = (DB_FILE, os.getpid())
+    if _watch_conn is None or _watch_key != key:
+        _watch_conn = sqlite3.connect(DB_FILE, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        _watch_key = key
+        _seen_data_version = None
+    return _watch_conn
+
+
+def _data_version():
+    """Return a number that changes whenever any connection or process commits to DB_FILE."""
+    with _watch_lock:
+        return _watch_connection().execute("PRAGMA data_version").fetchone()[0]
+
+
+@timed
+def check_catalogue_changed():
+    """Detect catalogue writes committed by other connections or processes.
+
+    Costs one PRAGMA data_version on a dedicated connection, plus one small
+    SELECT only when something has been committed since the last check.
+    Notifies on_catalogue_change() listeners and returns True on a change.
+    """
+    global _seen_data_version
+    with _watch_lock:
+        data_version = _watch_connection().execute("PRAGMA data_version").fetchone()[0]
+        if data_version == _seen_data_version:
+            return False
+        _seen_data_version = data_version
+        db_version = _read_db_catalogue_version(_watch_conn)
+        if db_version == _seen_db_version:
+            return False
+    _catalogue_changed(db_version)
+    return True
+
+
+class ConnectionPool:
+    """A small pool of long-lived SQLite connections.
+
+    A thread checks a connection out for the duration of an outermost
+    ``connection()`` block; nested blocks on the same thread reuse it, so a
+    function that calls another db function shares one transaction.
+    """
+
+    def __init__(self, db_file, max_size=None, pragmas=None):
+        self.db_file = db_file
+        self.max_size = max_size or POOL_MAX_SIZE
+        self.pragmas = dict(CONNECTION_PRAGMAS if pragmas is None else pragmas)
+        self.pid = os.getpid()
+        self._idle = []
+        self._all = {}
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self.opened = 0
+        self.reused = 0
+        self.wait_time = 0.0
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_file, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        conn.set_trace_callback(count_statement)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        self.opened += 1
+        self._all[id(conn)] = {"conn": conn, "checkouts": 0, "wait_time": 0.0}
+        return conn
+
+    def _checkout(self):
+        start = time.perf_counter()
+        with self._cond:
+            while not self._idle and len(self._all) >= self.max_size:
+                self._cond.wait()
+            if self._idle:
+                conn = self._idle.pop()
+                self.reused += 1
+            else:
+                conn = self._open()
+            waited = time.perf_counter() - start
+            self.wait_time += waited
+            stats = self._all[id(conn)]
+            stats["checkouts"] += 1
+            stats["wait_time"] += waited
+        return conn
+
+    def _checkin(self, conn):
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Yield this thread's connection, committing when the outermost block exits cleanly."""
+        local = self._local
+        if getattr(local, "conn", None) is not None:
+            local.depth += 1
+            try:
+                yield local.conn
+            finally:
+                local.depth -= 1
+            return
+
+        conn = self._checkout()
+        local.conn, local.depth = conn, 1
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            local.conn, local.depth = None, 0
+            self._checkin(conn)
+
+    def stats(self):
+        """Return pool-wide and per-connection usage statistics."""
+        with self._cond:
+            return {
+                "db_file": str(self.db_file),
+                "size": len(self._all),
+                "idle": len(self._idle),
+                "opened": self.opened,
+                "reused": self.reused,
+                "wait_time": self.wait_time,
+                "connections": [
+                    {"checkouts": s["checkouts"], "wait_time": s["wait_time"]}
+                    for s in self._all.values()
+                ],
+            }
+
+    def close(self):
+        """Close every idle connection and forget the rest."""
+        with self._cond:
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
+            self._all.clear()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool for DB_FILE, creating it on first use."""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.db_file == DB_FILE and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.db_file != DB_FILE or _pool.pid != os.getpid():
+            if _pool is not None and _pool.pid == os.getpid():
+                _pool.close()
+            _pool = ConnectionPool(DB_FILE)
+        return _pool
+
+
+def get_db_connection():
+    """Check out a pooled connection to the SQLite database.
+
+    Use as a context manager; the transaction is committed when the outermost
+    block exits and rolled back if it raises.
+    """
+    return get_pool().connection()
+
+
+def get_pool_stats():
+    """Return connection statistics for the current pool."""
+    return get_pool().stats()
+
+
+def close_pool():
+    """Close all pooled connections (e.g. at shutdown or after DB_FILE changes)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+@timed
 def init_db():
     """Initialize the SQLite database with products and categories tables."""
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
+    with get_db_connection() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        _create_schema(conn.cursor())
+
+
+def _create_schema(cur):
+    """Create the tables used by the POS if they do not exist yet."""
     
     # Create categories table with is_custom and created_at fields
     cur.execute('''
@@ -21,13 +296,18 @@ def init_db():
         )
     ''')
     
-    # Create products table
+    # Older databases stored prices as REAL pounds
+    _migrate_products_to_pence(cur)
+
+    # Create products table; prices are integer pence, and the event price is
+    # worked out when the price is written rather than on every render
     cur.execute('''
         CREATE TABLE IF NOT EXISTS products (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             category_id INTEGER NOT NULL,
             name TEXT NOT NULL,
-            price REAL NOT NULL,
+            price_pence INTEGER NOT NULL,
+            event_price_pence INTEGER NOT NULL,
             sku TEXT,
             stock INTEGER DEFAULT 0,
             UNIQUE(sku),
@@ -46,233 +326,816 @@ def init_db():
             FOREIGN KEY (product_id) REFERENCES products (id)
         )
     ''')
-    
-    conn.commit()
-    conn.close()
 
-def record_product_sale(product_id, quantity):
-    """Record a product sale in the database."""
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
+    # Create orders table so the lines of one checkout are grouped together
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            item_count INTEGER NOT NULL DEFAULT 0,
+            total_pence INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # Older databases predate orders, so add the link columns in place
+    _add_column_if_missing(cur, "product_sales", "order_id", "INTEGER REFERENCES orders (id)")
+    # Money is integer pence; older databases get pence columns filled from
+    # their REAL ones, which are no longer written
+    _add_pence_column(cur, "product_sales", "unit_price_pence", "unit_price")
+    _add_pence_column(cur, "orders", "total_pence", "total")
+
+    # Orders forwarded from other tills carry the till's own reference so a
+    # replayed submission is recognised rather than recorded twice
+    _add_column_if_missing(cur, "orders", "client_ref", "TEXT")
+    _add_column_if_missing(cur, "orders", "till_id", "TEXT")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_client_ref ON orders (client_ref)")
+
+    # Daily per-product rollup kept up to date as sales are recorded, so the
+    # popularity ranking never has to scan the raw sales log
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS product_sales_daily (
+            product_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (product_id, day)
+        ) WITHOUT ROWID
+    ''')
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_product_sales_date ON product_sales (sale_date, product_id, quantity)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_product_sales_order ON product_sales (order_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_product_sales_daily_day ON product_sales_daily (day, product_id, quantity)")
+
+    # Backfill the rollup the first time it is created on a database with history
+    cur.execute("SELECT EXISTS (SELECT 1 FROM product_sales_daily)")
+    if not cur.fetchone()[0]:
+        cur.execute('''
+            INSERT INTO product_sales_daily (product_id, day, quantity)
+            SELECT product_id, date(sale_date), SUM(quantity)
+            FROM product_sales
+            GROUP BY product_id, date(sale_date)
+        ''')
+
+    # Reporting rollups (see reports.py), in local time and caught up
+    # incrementally from the sales log; each source table's last rolled-up id
+    # is kept in report_watermarks
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS report_product_daily (
+            day TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            revenue_pence INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, product_id)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS report_product_monthly (
+            month TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            revenue_pence INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, product_id)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS report_hourly (
+            day TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            orders INTEGER NOT NULL DEFAULT 0,
+            items INTEGER NOT NULL DEFAULT 0,
+            revenue_pence INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, hour)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS report_watermarks (
+            source TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at)")
+
+    # Named price lists (members, happy hour, trade...): a markup on the
+    # standard price, per-product overrides, and optional activation windows.
+    # active_from/active_until are 'YYYY-MM-DD HH:MM:SS' and daily_start/daily_end
+    # 'HH:MM' local time; a daily window may run past midnight
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS price_lists (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            markup_percent INTEGER NOT NULL DEFAULT 0,
+            active_from TEXT,
+            active_until TEXT,
+            daily_start TEXT,
+            daily_end TEXT
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS price_list_items (
+            price_list_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            price_pence INTEGER NOT NULL,
+            PRIMARY KEY (price_list_id, product_id),
+            FOREIGN KEY (price_list_id) REFERENCES price_lists (id),
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        ) WITHOUT ROWID
+    ''')
+
+    # Catalogue version counter, bumped by triggers on any product, category or
+    # price list change (stock is excluded so sales do not invalidate the catalogue)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS catalogue_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cur.execute("INSERT OR IGNORE INTO catalogue_version (id, version) VALUES (1, 0)")
+    for name, event in [
+        ("products_inserted", "AFTER INSERT ON products"),
+        ("products_deleted", "AFTER DELETE ON products"),
+        ("products_updated", "AFTER UPDATE OF category_id, name, price_pence, event_price_pence, sku ON products"),
+        ("categories_inserted", "AFTER INSERT ON categories"),
+        ("categories_deleted", "AFTER DELETE ON categories"),
+        ("categories_updated", "AFTER UPDATE ON categories"),
+        ("price_lists_inserted", "AFTER INSERT ON price_lists"),
+        ("price_lists_deleted", "AFTER DELETE ON price_lists"),
+        ("price_lists_updated", "AFTER UPDATE ON price_lists"),
+        ("price_list_items_inserted", "AFTER INSERT ON price_list_items"),
+        ("price_list_items_deleted", "AFTER DELETE ON price_list_items"),
+        ("price_list_items_updated", "AFTER UPDATE ON price_list_items"),
+    ]:
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name} {event}
+            BEGIN
+                UPDATE catalogue_version SET version = version + 1 WHERE id = 1;
+            END
+        """)
+
+# Adds a sale to today's rollup row, creating it if this is the first sale of the day
+ROLLUP_UPSERT = """
+    INSERT INTO product_sales_daily (product_id, day, quantity)
+    VALUES (?, COALESCE(date(?, 'unixepoch'), date('now')), ?)
+    ON CONFLICT (product_id, day) DO UPDATE SET quantity = quantity + excluded.quantity
+"""
+
+def _table_columns(cur, table):
+    return {row[1] for row in cur.execute(f"PRAGMA table_info({table})")}
+
+def _migrate_products_to_pence(cur):
+    """Rebuild a products table that still has a REAL price column.
+
+    SQLite cannot change a column's type in place, so the table is copied
+    into a new one with price_pence and event_price_pence and swapped in;
+    ids (and so sales history) are kept.
+    """
+    columns = _table_columns(cur, "products")
+    if not columns or "price_pence" in columns:
+        return
+    # One transaction for the whole swap, committed with the rest of init_db()
+    if not cur.connection.in_transaction:
+        cur.execute("BEGIN IMMEDIATE")
+    cur.execute('''
+        CREATE TABLE products_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            price_pence INTEGER NOT NULL,
+            event_price_pence INTEGER NOT NULL,
+            sku TEXT,
+            stock INTEGER DEFAULT 0,
+            UNIQUE(sku),
+            FOREIGN KEY (category_id) REFERENCES categories (id),
+            UNIQUE(category_id, name)
+        )
+    ''')
+    rows = cur.execute("SELECT id, category_id, name, price, sku, stock FROM products").fetchall()
+    converted = []
+    for prod_id, category_id, name, price, sku, stock in rows:
+        pence = to_pence(price)
+        converted.append((prod_id, category_id, name, pence, event_price(pence), sku, stock))
+    cur.executemany("""
+        INSERT INTO products_new (id, category_id, name, price_pence, event_price_pence, sku, stock)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, converted)
+    cur.execute("DROP TABLE products")  # its triggers go with it and are recreated below
+    cur.execute("ALTER TABLE products_new RENAME TO products")
+
+def _add_pence_column(cur, table, column, old_column):
+    """Add an integer pence column, converting values from a REAL pounds column if there is one."""
+    columns = _table_columns(cur, table)
+    if column in columns:
+        return
+    cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+    if old_column in columns:
+        cur.execute(f"UPDATE {table} SET {column} = CAST(ROUND({old_column} * 100) AS INTEGER) "
+                    f"WHERE {old_column} IS NOT NULL")
+
+def _add_column_if_missing(cur, table, column, declaration):
+    """Add a column to an existing table unless it is already there."""
+    columns = [row[1] for row in cur.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+class OutOfStockError(Exception):
+    """Raised when a checkout asks for more of a product than is in stock."""
+
+    def __init__(self, product_ids):
+        super().__init__(f"Insufficient stock for product(s) {', '.join(map(str, product_ids))}")
+        self.product_ids = product_ids
+
+@contextmanager
+def _write_transaction(conn, name="write"):
+    """Run a block of writes atomically.
+
+    At the top level this takes the write lock up front with BEGIN
+    IMMEDIATE (the pool commits or rolls back). Inside an existing
+    transaction it uses a savepoint, so a failed block is undone without
+    aborting the caller's other work.
+    """
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+        yield
+        return
+    conn.execute(f"SAVEPOINT {name}")
     try:
+        yield
+    except BaseException:
+        conn.execute(f"ROLLBACK TO {name}")
+        conn.execute(f"RELEASE {name}")
+        raise
+    conn.execute(f"RELEASE {name}")
+
+def _decrement_stock(cur, lines, check_stock=True):
+    """Take each product's total quantity off its stock, or raise OutOfStockError.
+
+    The conditional UPDATE checks and decrements in one statement, so two
+    tills selling the last item cannot both succeed.
+    """
+    wanted = {}
+    for product_id, quantity, _ in lines:
+        wanted[product_id] = wanted.get(product_id, 0) + quantity
+    if not check_stock:
+        # The sale has already happened elsewhere; record it even if stock runs negative
+        cur.executemany("UPDATE products SET stock = stock - ? WHERE id = ?",
+                        [(quantity, product_id) for product_id, quantity in wanted.items()])
+        return
+    short = []
+    for product_id, quantity in wanted.items():
         cur.execute(
-            "INSERT INTO product_sales (product_id, quantity) VALUES (?, ?)",
-            (product_id, quantity)
+            "UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?",
+            (quantity, product_id, quantity)
         )
-        conn.commit()
+        if cur.rowcount == 0:
+            short.append(product_id)
+    if short:
+        raise OutOfStockError(short)
+
+@timed
+def get_stock_levels(product_ids):
+    """Return {product_id: stock} for the given products; unknown ids are left out."""
+    product_ids = list(set(product_ids))
+    if not product_ids:
+        return {}
+    with get_db_connection() as conn:
+        placeholders = ", ".join("?" * len(product_ids))
+        return {prod_id: stock or 0 for prod_id, stock in conn.execute(
+            f"SELECT id, stock FROM products WHERE id IN ({placeholders})", product_ids)}
+
+@timed
+def record_order(order_lines, client_ref=None, till_id=None, check_stock=True, taken_at=None):
+    """Record a whole checkout in a single transaction.
+
+    order_lines is an iterable of (product_id, quantity, unit_price) tuples,
+    with unit_price in integer pence.
+    Stock is decremented first and an orders header row written, then every
+    line is linked to it, so either the whole basket is saved or none of it
+    is. Returns the new order id, or None if nothing was recorded. Raises
+    OutOfStockError (after rolling back) if any product would go below zero,
+    unless check_stock is False.
+
+    client_ref and till_id identify an order forwarded from another till;
+    recording the same client_ref again returns the existing order's id.
+    taken_at (Unix seconds) dates an order recorded after it was taken.
+    """
+    lines = [(product_id, quantity, unit_price)
+             for product_id, quantity, unit_price in order_lines if quantity > 0]
+    if not lines:
+        return None
+
+    try:
+        with get_db_connection() as conn, _write_transaction(conn, "record_order"):
+            cur = conn.cursor()
+            if client_ref is not None:
+                cur.execute("SELECT id FROM orders WHERE client_ref = ?", (client_ref,))
+                existing = cur.fetchone()
+                if existing:
+                    return existing[0]
+            _decrement_stock(cur, lines, check_stock)
+            # created_at and sale_date are UTC, as CURRENT_TIMESTAMP writes them
+            cur.execute("""
+                INSERT INTO orders (created_at, item_count, total_pence, client_ref, till_id)
+                VALUES (COALESCE(datetime(?, 'unixepoch'), CURRENT_TIMESTAMP), ?, ?, ?, ?)
+            """, (taken_at, sum(q for _, q, _ in lines), sum(q * (p or 0) for _, q, p in lines),
+                  client_ref, till_id))
+            order_id = cur.lastrowid
+            cur.executemany("""
+                INSERT INTO product_sales (order_id, product_id, quantity, unit_price_pence, sale_date)
+                VALUES (?, ?, ?, ?, COALESCE(datetime(?, 'unixepoch'), CURRENT_TIMESTAMP))
+            """, [(order_id, product_id, quantity, unit_price, taken_at)
+                  for product_id, quantity, unit_price in lines])
+            cur.executemany(ROLLUP_UPSERT, [(product_id, taken_at, quantity) for product_id, quantity, _ in lines])
+        popular_cache.invalidate()
+        return order_id
+    except OutOfStockError:
+        raise
+    except Exception as e:
+        print(f"Error recording order: {e}")
+        return None
+
+@timed
+def record_product_sale(product_id, quantity):
+    """Record a product sale in the database, taking it off stock."""
+    try:
+        with get_db_connection() as conn, _write_transaction(conn, "record_sale"):
+            _decrement_stock(conn.cursor(), [(product_id, quantity, None)])
+            conn.execute(
+                "INSERT INTO product_sales (product_id, quantity) VALUES (?, ?)",
+                (product_id, quantity)
+            )
+            conn.execute(ROLLUP_UPSERT, (product_id, None, quantity))
+        popular_cache.invalidate()
         return True
     except Exception as e:
         print(f"Error recording sale: {e}")
         return False
-    finally:
-        conn.close()
 
+@timed
 def get_popular_products(days=90, limit=15):
     """Get the most popular products based on sales within a specified time period."""
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    
+    data_version = _data_version()
+    cached = popular_cache.get((days, limit), version=data_version)
+    if cached is not None:
+        return list(cached)
+
     try:
-        # First check if we have any sales data
-        cur.execute("SELECT COUNT(*) FROM product_sales")
-        count = cur.fetchone()[0]
-        
-        if count == 0:
-            return []
-            
-        cur.execute("""
-            SELECT p.id, c.name as category, p.name, p.price, p.sku, p.stock, 
-                   SUM(ps.quantity) as total_sold
-            FROM products p
-            JOIN categories c ON p.category_id = c.id
-            JOIN product_sales ps ON p.id = ps.product_id
-            WHERE ps.sale_date > datetime('now', ? || ' days')
-            GROUP BY p.id
-            ORDER BY total_sold DESC
-            LIMIT ?
-        """, (f"-{days}", limit))
-        
-        popular_products = []
-        for prod_id, category, name, price, sku, stock, _ in cur.fetchall():
-            popular_products.append((name, price, sku, stock, prod_id))
-            
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+
+            # Range scan over the daily rollup rather than the raw sales log
+            cur.execute("""
+                SELECT p.id, c.name as category, p.name, p.price_pence, p.sku, p.stock,
+                       p.event_price_pence, SUM(d.quantity) as total_sold
+                FROM product_sales_daily d
+                JOIN products p ON p.id = d.product_id
+                JOIN categories c ON p.category_id = c.id
+                WHERE d.day >= date('now', ? || ' days')
+                GROUP BY p.id
+                ORDER BY total_sold DESC
+                LIMIT ?
+            """, (f"-{days}", limit))
+
+            popular_products = []
+            for prod_id, category, name, price, sku, stock, event, _ in cur.fetchall():
+                popular_products.append((name, price, sku, stock, prod_id, event))
+
+        popular_cache.set((days, limit), tuple(popular_products), version=data_version)
         return popular_products
     except Exception as e:
         print(f"Error getting popular products: {e}")
         return []
-    finally:
-        conn.close()
 
 # Add new functions for category management
+@timed
 def add_category(name):
     """Add a new custom category."""
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
     try:
-        cur.execute(
-            "INSERT INTO categories (name, is_custom) VALUES (?, TRUE)",
-            (name,)
-        )
-        conn.commit()
+        with get_db_connection() as conn:
+            conn.execute(
+                "INSERT INTO categories (name, is_custom) VALUES (?, TRUE)",
+                (name,)
+            )
+        _catalogue_changed()
         return True
     except sqlite3.Error as e:
         print(f"Error adding category: {e}")
         return False
-    finally:
-        conn.close()
 
+@timed
 def delete_category(category_id):
     """Delete a custom category if it has no products."""
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
     try:
-        # Check if category is custom and has no products
-        cur.execute("""
-            SELECT c.is_custom, COUNT(p.id)
-            FROM categories c
-            LEFT JOIN products p ON c.id = p.category_id
-            WHERE c.id = ?
-            GROUP BY c.id
-        """, (category_id,))
-        result = cur.fetchone()
-        
-        if result and result[0] and result[1] == 0:
-            cur.execute("DELETE FROM categories WHERE id = ?", (category_id,))
-            conn.commit()
-            return True
-        return False
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            # Check if category is custom and has no products
+            cur.execute("""
+                SELECT c.is_custom, COUNT(p.id)
+                FROM categories c
+                LEFT JOIN products p ON c.id = p.category_id
+                WHERE c.id = ?
+                GROUP BY c.id
+            """, (category_id,))
+            result = cur.fetchone()
+
+            if result and result[0] and result[1] == 0:
+                cur.execute("DELETE FROM categories WHERE id = ?", (category_id,))
+            else:
+                return False
+        _catalogue_changed()
+        return True
     except sqlite3.Error as e:
         print(f"Error deleting category: {e}")
         return False
-    finally:
-        conn.close()
 
 # Add new functions for product management
-def get_db_connection():
-    """Create a connection to the SQLite database."""
-    db_path = Path("products.db")
-    return sqlite3.connect(db_path)
-
+@timed
 def add_product(category_id, name, price, sku, stock):
-    """Add a new product to the database."""
+    """Add a new product to the database; price is in integer pence."""
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO products (category_id, name, price, sku, stock)
-                VALUES (?, ?, ?, ?, ?)
-            """, (category_id, name, price, sku, stock))
-            conn.commit()
-            return True
+            conn.execute("""
+                INSERT INTO products (category_id, name, price_pence, event_price_pence, sku, stock)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (category_id, name, price, event_price(price), sku, stock))
+        _catalogue_changed()
+        return True
     except Exception as e:
         print(f"Error adding product: {e}")
         return False
 
+@timed
 def edit_product(product_id, name, category_id, price, sku, stock):
-    """Edit an existing product."""
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
+    """Edit an existing product; price is in integer pence."""
     try:
-        cur.execute("""
-            UPDATE products
-            SET category_id = ?, name = ?, price = ?, sku = ?, stock = ?
-            WHERE id = ?
-        """, (category_id, name, price, sku, stock, product_id))
-        conn.commit()
+        with get_db_connection() as conn:
+            conn.execute("""
+                UPDATE products
+                SET category_id = ?, name = ?, price_pence = ?, event_price_pence = ?, sku = ?, stock = ?
+                WHERE id = ?
+            """, (category_id, name, price, event_price(price), sku, stock, product_id))
+        _catalogue_changed()
         return True
     except sqlite3.Error as e:
         print(f"Error editing product: {e}")
         return False
-    finally:
-        conn.close()
 
+@timed
 def delete_product(product_id):
     """Delete a product."""
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
     try:
-        cur.execute("DELETE FROM products WHERE id = ?", (product_id,))
-        conn.commit()
+        with get_db_connection() as conn:
+            conn.execute("DELETE FROM price_list_items WHERE product_id = ?", (product_id,))
+            conn.execute("DELETE FROM products WHERE id = ?", (product_id,))
+        _catalogue_changed()
         return True
     except sqlite3.Error as e:
         print(f"Error deleting product: {e}")
         return False
-    finally:
-        conn.close()
 
+@timed
+def add_price_list(name, markup_percent=0, active_from=None, active_until=None, daily_start=None, daily_end=None):
+    """Create a price list; returns its id, or None if it could not be added."""
+    try:
+        with get_db_connection() as conn:
+            cur = conn.execute("""
+                INSERT INTO price_lists (name, markup_percent, active_from, active_until, daily_start, daily_end)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (name, markup_percent, active_from, active_until, daily_start, daily_end))
+            price_list_id = cur.lastrowid
+        _catalogue_changed()
+        return price_list_id
+    except sqlite3.Error as e:
+        print(f"Error adding price list: {e}")
+        return None
+
+@timed
+def edit_price_list(price_list_id, name, markup_percent=0, active_from=None, active_until=None,
+                    daily_start=None, daily_end=None):
+    """Change a price list's name, markup or activation window."""
+    try:
+        with get_db_connection() as conn:
+            conn.execute("""
+                UPDATE price_lists
+                SET name = ?, markup_percent = ?, active_from = ?, active_until = ?, daily_start = ?, daily_end = ?
+                WHERE id = ?
+            """, (name, markup_percent, active_from, active_until, daily_start, daily_end, price_list_id))
+        _catalogue_changed()
+        return True
+    except sqlite3.Error as e:
+        print(f"Error editing price list: {e}")
+        return False
+
+@timed
+def delete_price_list(price_list_id):
+    """Delete a price list and its overrides."""
+    try:
+        with get_db_connection() as conn:
+            conn.execute("DELETE FROM price_list_items WHERE price_list_id = ?", (price_list_id,))
+            conn.execute("DELETE FROM price_lists WHERE id = ?", (price_list_id,))
+        _catalogue_changed()
+        return True
+    except sqlite3.Error as e:
+        print(f"Error deleting price list: {e}")
+        return False
+
+@timed
+def set_price_override(price_list_id, product_id, price):
+    """Fix a product's price (in pence) on a price list; None removes the override."""
+    try:
+        with get_db_connection() as conn:
+            if price is None:
+                conn.execute("DELETE FROM price_list_items WHERE price_list_id = ? AND product_id = ?",
+                             (price_list_id, product_id))
+            else:
+                conn.execute("""
+                    INSERT INTO price_list_items (price_list_id, product_id, price_pence) VALUES (?, ?, ?)
+                    ON CONFLICT (price_list_id, product_id) DO UPDATE SET price_pence = excluded.price_pence
+                """, (price_list_id, product_id, price))
+        _catalogue_changed()
+        return True
+    except sqlite3.Error as e:
+        print(f"Error setting price override: {e}")
+        return False
+
+@timed
+def get_price_lists():
+    """Return every price list as a dict, with its overrides as {product_id: pence}."""
+    key = ("lists", get_catalogue_version())
+    cached = price_list_cache.get(key)
+    if cached is not None:
+        return cached
+    with get_db_connection() as conn:
+        price_lists = [
+            {"id": row[0], "name": row[1], "markup_percent": row[2], "active_from": row[3],
+             "active_until": row[4], "daily_start": row[5], "daily_end": row[6], "overrides": {}}
+            for row in conn.execute("""
+                SELECT id, name, markup_percent, active_from, active_until, daily_start, daily_end
+                FROM price_lists ORDER BY name
+            """)
+        ]
+        by_id = {price_list["id"]: price_list for price_list in price_lists}
+        for price_list_id, product_id, price in conn.execute(
+                "SELECT price_list_id, product_id, price_pence FROM price_list_items"):
+            if price_list_id in by_id:
+                by_id[price_list_id]["overrides"][product_id] = price
+    price_list_cache.set(key, price_lists)
+    return price_lists
+
+def get_price_list(price_list_id):
+    """Return one price list dict from get_price_lists(), or None."""
+    for price_list in get_price_lists():
+        if price_list["id"] == price_list_id:
+            return price_list
+    return None
+
+def price_list_active(price_list, now=None):
+    """Return whether a price list's date range and daily window include now."""
+    now = now or datetime.now()
+    stamp = now.strftime("%Y-%m-%d %H:%M:%S")
+    if price_list["active_from"] and stamp < price_list["active_from"]:
+        return False
+    if price_list["active_until"] and stamp >= price_list["active_until"]:
+        return False
+    start, end = price_list["daily_start"], price_list["daily_end"]
+    if start and end:
+        clock = now.strftime("%H:%M")
+        if start <= end:
+            return start <= clock < end
+        return clock >= start or clock < end  # runs past midnight
+    return True
+
+def effective_price_list(price_list, now=None):
+    """Return the price list a session should be charged on right now.
+
+    A named price list outside its activation window (or since deleted)
+    falls back to standard prices (None).
+    """
+    if price_list is None or price_list == EVENT_PRICE_LIST:
+        return price_list
+    details = get_price_list(price_list)
+    if details is None or not price_list_active(details, now):
+        return None
+    return price_list
+
+@timed
+def _resolve_price_list_prices(price_list_id):
+    """Resolve every product's price on a named price list from the database."""
+    details = get_price_list(price_list_id)
+    prices = {}
+    if details is not None:
+        overrides = details["overrides"]
+        markup = details["markup_percent"]
+        with get_db_connection() as conn:
+            for product_id, price in conn.execute("SELECT id, price_pence FROM products"):
+                override = overrides.get(product_id)
+                prices[product_id] = override if override is not None else apply_markup(price, markup)
+    return prices
+
+def get_price_list_prices(price_list_id):
+    """Return {product_id: pence} for every product on a named price list, cached per catalogue version."""
+    key = (price_list_id, get_catalogue_version())
+    prices = price_list_cache.get(key)
+    if prices is None:
+        prices = _resolve_price_list_prices(price_list_id)
+        price_list_cache.set(key, prices)
+    return prices
+
+def product_price(product_id, price, event_price, price_list):
+    """Return what a product costs (in pence) on price_list, as given by effective_price_list()."""
+    if price_list is None:
+        return price
+    if price_list == EVENT_PRICE_LIST:
+        return event_price
+    return get_price_list_prices(price_list).get(product_id, price)
+
+def get_popular_cache_stats():
+    """Return hit/miss counters for the popular products cache."""
+    return popular_cache.stats()
+
+@timed
 def get_categories():
     """Get all categories with their product counts."""
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT c.id, c.name, c.is_custom, c.created_at, COUNT(p.id) as product_count
-        FROM categories c
-        LEFT JOIN products p ON c.id = p.category_id
-        GROUP BY c.id
-        ORDER BY c.name
-    """)
-    categories = cur.fetchall()
-    conn.close()
-    return categories
+    with get_db_connection() as conn:
+        return conn.execute("""
+            SELECT c.id, c.name, c.is_custom, c.created_at, COUNT(p.id) as product_count
+            FROM categories c
+            LEFT JOIN products p ON c.id = p.category_id
+            GROUP BY c.id
+            ORDER BY c.name
+        """).fetchall()
 
 # Modify existing functions as needed
+@timed
 def get_products():
-    """Load products from the database."""
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT c.name, p.name, p.price, p.sku, p.stock, p.id
-        FROM products p 
-        JOIN categories c ON p.category_id = c.id
-        ORDER BY c.name, p.name
-    """)
-    rows = cur.fetchall()
-    conn.close()
-
-    products = {"Home": []}
-    for category, name, price, sku, stock, prod_id in rows:
-        if category not in products:
-            products[category] = []
-        product_info = (name, price, sku, stock, prod_id)
-        products[category].append(product_info)
-        products["Home"].append(product_info)
-    
-    return products
+    """Load products from the database.
+
+    Returns a product_table.ProductTable, which maps each category to its
+    (name, price, sku, stock, id, event_price) rows with prices in integer
+    pence; "Home" lists every product. Rows are streamed from the cursor
+    straight into the table's columns.
+    """
+    with get_db_connection() as conn:
+        return ProductTable.from_rows(conn.execute("""
+            SELECT c.name, p.name, p.price_pence, p.sku, p.stock, p.id, p.event_price_pence
+            FROM products p 
+            JOIN categories c ON p.category_id = c.id
+            ORDER BY c.name, p.name
+        """))
+
+def _parse_product_row(row):
+    """Validate one CSV row and return (category, name, price, sku, stock), price in pence."""
+    category = (row.get('category') or '').strip()
+    name = (row.get('name') or '').strip()
+    if not category:
+        raise ValueError("missing category")
+    if not name:
+        raise ValueError("missing name")
+    price = to_pence(row.get('price') or '')
+    if price < 0:
+        raise ValueError(f"negative price {row.get('price')}")
+    try:
+        stock = int(row.get('stock') or 0)
+    except ValueError:
+        raise ValueError(f"invalid stock {row.get('stock')!r}")
+    sku = (row.get('sku') or '').strip() or None
+    return category, name, price, sku, stock
+
+@timed
+def bulk_import_products(filename, progress=None, progress_every=10000):
+    """Import or update products from a CSV file in a single transaction.
+
+    The file is streamed and validated row by row, every category is
+    resolved in one pass, and products are written with executemany.
+    Products are matched on (category, name): new ones are inserted,
+    changed ones updated in place (keeping their id and sales history) and
+    identical ones left alone. A row whose SKU already belongs to another
+    product is reported as an error and skipped.
+
+    progress, if given, is called as progress(rows_read, elapsed_seconds)
+    every progress_every rows. Returns a report dict with row counts,
+    per-row validation errors as (line_number, message) and rows_per_sec.
+    """
+    start = time.perf_counter()
+    report = {"rows": 0, "inserted": 0, "updated": 0, "unchanged": 0, "errors": []}
+
+    # Stream and validate; a later row for the same product wins
+    rows = {}
+    with open(filename, 'r', newline='', encoding='utf-8-sig') as file:
+        for line_number, row in enumerate(csv.DictReader(file), start=2):
+            report["rows"] += 1
+            try:
+                category, name, price, sku, stock = _parse_product_row(row)
+            except ValueError as e:
+                report["errors"].append((line_number, str(e)))
+                continue
+            rows[(category, name)] = (line_number, price, sku, stock)
+            if progress and report["rows"] % progress_every == 0:
+                progress(report["rows"], time.perf_counter() - start)
+
+    with get_db_connection() as conn:
+        inserts, updates = _upsert_products(conn.cursor(), rows, report)
+
+    report["inserted"] = inserts
+    report["updated"] = updates
+    report["seconds"] = time.perf_counter() - start
+    report["rows_per_sec"] = report["rows"] / report["seconds"] if report["seconds"] else 0.0
+    if inserts or updates:
+        _catalogue_changed()
+    return report
+
+def _upsert_products(cur, rows, report, delete_missing=False):
+    """Insert or update products in bulk; returns (inserted, updated) counts.
 
-# Add this function to db.py
+    rows maps (category, name) to (ref, price, sku, stock), with price in
+    pence and ref used to identify the row in report["errors"]. Event prices
+    are worked out here, as the prices are written. Unchanged products are
+    counted in report["unchanged"]. With delete_missing, products not in
+    rows are deleted.
+    """
+    # Resolve every category up front
+    cur.executemany("INSERT OR IGNORE INTO categories (name) VALUES (?)",
+                    [(category,) for category in {category for category, _ in rows}])
+    category_ids = dict(cur.execute("SELECT name, id FROM categories"))
+
+    existing = {}
+    sku_owner = {}
+    for prod_id, category_id, name, price, sku, stock in cur.execute(
+            "SELECT id, category_id, name, price_pence, sku, stock FROM products"):
+        existing[(category_id, name)] = (prod_id, price, sku, stock)
+        if sku:
+            sku_owner[sku] = prod_id
+
+    if delete_missing:
+        keep = {(category_ids[category], name) for category, name in rows}
+        gone = [(current[0],) for key, current in existing.items() if key not in keep]
+        cur.executemany("DELETE FROM products WHERE id = ?", gone)
+        gone_ids = {prod_id for prod_id, in gone}
+        sku_owner = {sku: prod_id for sku, prod_id in sku_owner.items() if prod_id not in gone_ids}
+
+    inserts, updates = [], []
+    for (category, name), (ref, price, sku, stock) in rows.items():
+        category_id = category_ids[category]
+        current = existing.get((category_id, name))
+        # A new product has no id yet; its key tells it apart from other new rows
+        owner = current[0] if current else (category_id, name)
+        if sku and sku_owner.get(sku, owner) != owner:
+            report["errors"].append((ref, f"SKU {sku} already used by another product"))
+            continue
+        if sku:
+            sku_owner[sku] = owner
+        if current is None:
+            inserts.append((category_id, name, price, event_price(price), sku, stock))
+        elif current[1:] != (price, sku, stock):
+            updates.append((price, event_price(price), sku, stock, owner))
+        else:
+            report["unchanged"] += 1
+
+    cur.executemany("""
+        INSERT INTO products (category_id, name, price_pence, event_price_pence, sku, stock)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, inserts)
+    cur.executemany("UPDATE products SET price_pence = ?, event_price_pence = ?, sku = ?, stock = ? WHERE id = ?",
+                    updates)
+    return len(inserts), len(updates)
+
+@timed
+def get_catalogue_rows():
+    """Return (db_version, [(category, name, price, sku, stock), ...]) in one read, price in pence."""
+    with get_db_connection() as conn:
+        version = _read_db_catalogue_version(conn)
+        rows = conn.execute("""
+            SELECT c.name, p.name, p.price_pence, p.sku, p.stock
+            FROM products p
+            JOIN categories c ON p.category_id = c.id
+            ORDER BY c.name, p.name
+        """).fetchall()
+    return version, rows
+
+@timed
+def apply_catalogue(rows):
+    """Make the local products match rows of (category, name, price, sku, stock).
+
+    Used by tills to take the catalogue pushed from the sync server; products
+    missing from rows are deleted. Returns the same report as bulk_import_products.
+    """
+    report = {"rows": 0, "inserted": 0, "updated": 0, "unchanged": 0, "errors": []}
+    products = {}
+    for ref, (category, name, price, sku, stock) in enumerate(rows):
+        report["rows"] += 1
+        products[(category, name)] = (ref, price, sku, stock)
+    with get_db_connection() as conn:
+        report["inserted"], report["updated"] = _upsert_products(conn.cursor(), products, report, delete_missing=True)
+    _catalogue_changed()
+    return report
+
+@timed
 def import_products_from_csv(filename):
     """Import products from a CSV file."""
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    
     try:
-        with open(filename, 'r') as file:
-            csv_reader = csv.DictReader(file)
-            for row in csv_reader:
-                # First, ensure category exists
-                cur.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)",
-                          (row['category'],))
-                conn.commit()
-                
-                # Get category_id
-                cur.execute("SELECT id FROM categories WHERE name = ?",
-                          (row['category'],))
-                category_id = cur.fetchone()[0]
-                
-                # Insert product
-                cur.execute("""
-                    INSERT OR REPLACE INTO products 
-                    (category_id, name, price, sku, stock)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (category_id, row['name'], float(row['price']), 
-                     row.get('sku', None), int(row.get('stock', 0))))
-                
-        conn.commit()
-        return True
+        report = bulk_import_products(filename)
     except Exception as e:
         print(f"Error importing products: {e}")
-        conn.rollback()
         return False
-    finally:
-        conn.close()
+    for line_number, message in report["errors"]:
+        print(f"Skipped {filename} line {line_number}: {message}")
+    print(f"Imported {filename}: {report['inserted']} inserted, {report['updated']} updated, "
+          f"{report['unchanged']} unchanged ({report['rows_per_sec']:.0f} rows/sec)")
+    return True
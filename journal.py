@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+from collections import deque
+
+
+class Journal:
+    """An append-only, fsynced queue of JSON records stored in a file.
+
+    append() returns only once the record is on disk, so nothing accepted is
+    lost if the process or machine dies. Consumers read pending() records in
+    order and call ack(seq) once they have been delivered; the acknowledged
+    position is kept in a small ``<path>.ack`` file, and the journal file is
+    truncated whenever everything in it has been acknowledged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.ack_path = path + ".ack"
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self.acked = self._read_ack()
+        self.last_seq = self.acked
+        self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _read_ack(self):
+        try:
+            with open(self.ack_path, encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _load(self):
+        """Read back records that were appended but never acknowledged."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r+", encoding="utf-8") as f:
+            data = f.read()
+            for line in data.splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn write from a crash mid-append
+                self.last_seq = max(self.last_seq, entry["seq"])
+                if entry["seq"] > self.acked:
+                    self._pending.append((entry["seq"], entry["record"]))
+            if data and not data.endswith("\n"):
+                f.write("\n")  # keep the next append on its own line
+
+    def append(self, record):
+        """Durably add a record and return its sequence number."""
+        with self._lock:
+            seq = self.last_seq + 1
+            self._file.write(json.dumps({"seq": seq, "record": record}, separators=(",", ":")) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.last_seq = seq
+            self._pending.append((seq, record))
+            return seq
+
+    def pending(self, limit=None):
+        """Return unacknowledged (seq, record) pairs, oldest first."""
+        with self._lock:
+            items = list(self._pending)
+        return items if limit is None else items[:limit]
+
+    def ack(self, seq):
+        """Mark every record up to and including seq as delivered."""
+        with self._lock:
+            while self._pending and self._pending[0][0] <= seq:
+                self._pending.popleft()
+            self.acked = max(self.acked, seq)
+            tmp_path = self.ack_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(str(self.acked))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.ack_path)
+            if not self._pending:
+                self._file.truncate(0)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
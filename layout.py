@@ -1,95 +1,169 @@
+import json
+
 from dash import dcc, html
 import dash_bootstrap_components as dbc
-from db import get_popular_products
+from cache import LRUCache
+from money import format_pence
+from db import (EVENT_PRICE_LIST, get_popular_products, get_catalogue_version, get_price_list,
+                get_price_lists, on_catalogue_change, price_list_active, product_price)
+
+# Shared style dicts so every button and grid cell does not build its own copy
+BUTTON_STYLE = {
+    "height": "90px",  # Slightly smaller height for the 6-button layout
+    "whiteSpace": "normal",
+    "padding": "8px",  # Reduced padding
+    "display": "flex",
+    "flexDirection": "column",
+    "justifyContent": "center",
+    "alignItems": "flex-start",  # Left alignment
+    "width": "100%",
+    "borderColor": "#ccc",
+    "backgroundColor": "#f8f9fa"
+}
+BUTTON_TEXT_STYLE = {"fontSize": "14px", "color": "black"}
+GRID_CELL_STYLE = {"width": "16.666%", "padding": "2px", "boxSizing": "border-box"}  # 6 per row
+GRID_ROW_STYLE = {"width": "100%", "display": "flex", "flexWrap": "nowrap"}
+
+# Categories are sent a page at a time; scrolling to the end of a grid loads
+# the next page (assets/grid.js)
+GRID_COLUMNS = 6
+GRID_PAGE_ROWS = 8
+GRID_PAGE_SIZE = GRID_COLUMNS * GRID_PAGE_ROWS
+LOAD_MORE_STYLE = {"width": "100%"}
+
+# How often (ms) an open page asks whether the catalogue has changed
+CATALOGUE_POLL_INTERVAL = 2000
+
+# Seconds the search box waits after the last keystroke before searching
+SEARCH_DEBOUNCE = 0.1
+
+# Rendered grid pages keyed by (category, price_list, catalogue_version, page).
+# The version in the key makes stale entries unreachable; clearing on change frees them.
+GRID_CACHE_SIZE = 256
+grid_cache = LRUCache(maxsize=GRID_CACHE_SIZE)
+on_catalogue_change(grid_cache.clear)
 
-def create_product_button_content(name, price, sku, stock, event_pricing_active=False):
+def create_product_button_content(name, price, sku, stock, prod_id, price_list=None, event_price=None):
     """Create the content for a product button."""
-    display_price = price * 1.1 if event_pricing_active else price
     # No break between name and price - all in one div with left alignment
     return html.Div([
         html.Strong(name, style={"fontSize": "14px", "color": "black"}),
         html.Br(),
-        html.Span(f"£{display_price:.2f}", style={"fontSize": "14px", "color": "black"})
+        html.Span(format_price(prod_id, price, event_price, price_list),
+                  style={"fontSize": "14px", "color": "black"})
     ], style={"textAlign": "left"})
 
-def product_button(name, price, sku, stock, prod_id, category, event_pricing_active=False):
-    """Create a single product button with consistent sizing."""
-    # Apply event pricing to the actual price here
-    display_price = price * 1.1 if event_pricing_active else price
-    button_id = {"type": "product-button", "category": category, "name": name.replace('.', '_')}
+def format_price(prod_id, price, event_price, price_list=None):
+    """Format a product's price (in pence) for display on the given price list."""
+    return format_pence(product_price(prod_id, price, event_price, price_list))
+
+def basket_product(name, price, sku, stock, event_price):
+    """Return what the client-side basket needs to add a product to the order."""
+    return {"name": name, "price": price, "event_price": event_price, "sku": sku, "stock": stock}
+
+def product_button(name, price, sku, stock, prod_id, category, price_list=None, event_price=None):
+    """Create a single product button with consistent sizing.
+
+    The button's value carries the product's basket_product() details, so
+    the client-side basket can add it without a catalogue of its own.
+    """
+    button_id = {"type": "product-button", "category": category, "product_id": prod_id}
+    # The price label has its own id so a price list switch can update just the text
+    price_id = {"type": "price-label", "category": category, "product_id": prod_id}
     
     return dbc.Button(
         children=html.Div([
-            html.Strong(name, style={"fontSize": "14px", "color": "black"}),
+            html.Strong(name, style=BUTTON_TEXT_STYLE),
             html.Br(),
-            html.Span(f"£{display_price:.2f}", style={"fontSize": "14px", "color": "black"})
+            html.Span(format_price(prod_id, price, event_price, price_list), id=price_id,
+                      style=BUTTON_TEXT_STYLE)
         ], style={"textAlign": "left"}),
         id=button_id,
+        value=json.dumps(basket_product(name, price, sku, stock, event_price), separators=(",", ":")),
         color="light",
         outline=True,
-        style={
-            "height": "90px",  # Slightly smaller height for the 6-button layout
-            "whiteSpace": "normal",
-            "padding": "8px",  # Reduced padding
-            "display": "flex",
-            "flexDirection": "column",
-            "justifyContent": "center",
-            "alignItems": "flex-start",  # Left alignment
-            "width": "100%",
-            "borderColor": "#ccc",
-            "backgroundColor": "#f8f9fa"
-        },
+        style=BUTTON_STYLE,
         n_clicks=0,
     )
 
-def create_product_grid(products, category, event_pricing_active=False):
-    """Create a grid of product buttons with 6 per row."""
-    items = list(products[category])
+def product_grid_rows(items, category, price_list=None):
+    """Return the grid rows, 6 buttons per row, for a list of product tuples."""
+    items = list(items)
     rows = []
     
     # Process 6 items per row (changed from 5)
-    for i in range(0, len(items), 6):
-        current_row = items[i:i+6]
+    for i in range(0, len(items), GRID_COLUMNS):
+        current_row = items[i:i+GRID_COLUMNS]
         buttons = []
         
         # Create button for each product
-        for name, price, sku, stock, prod_id in current_row:
+        for name, price, sku, stock, prod_id, event_price in current_row:
             buttons.append(
                 html.Div(
-                    product_button(name, price, sku, stock, prod_id, category, event_pricing_active),
-                    style={"width": "16.666%", "padding": "2px", "boxSizing": "border-box"},  # Changed from 20% to 16.666%
+                    product_button(name, price, sku, stock, prod_id, category, price_list, event_price),
+                    style=GRID_CELL_STYLE,
                     className="d-inline-block"
                 )
             )
             
         # Add empty placeholders if row isn't complete
-        for _ in range(6 - len(current_row)):  # Changed from 5 to 6
-            buttons.append(
-                html.Div(
-                    style={"width": "16.666%", "padding": "2px", "boxSizing": "border-box"},  # Changed from 20% to 16.666%
-                    className="d-inline-block"
-                )
-            )
+        for _ in range(GRID_COLUMNS - len(current_row)):
+            buttons.append(html.Div(style=GRID_CELL_STYLE, className="d-inline-block"))
         
         # Add completed row to rows list
         rows.append(
-            html.Div(
-                buttons,
-                style={"width": "100%", "display": "flex", "flexWrap": "nowrap"}
-            )
+            html.Div(buttons, style=GRID_ROW_STYLE)
         )
-    
-    return html.Div(rows, style={"width": "100%"})
+    return rows
+
+def create_product_grid(products, category, price_list=None):
+    """Create a grid of product buttons with 6 per row."""
+    return html.Div(product_grid_rows(products[category], category, price_list), style={"width": "100%"})
+
+def product_page(products, category, page, price_list=None):
+    """Return the grid rows for one page of a category, reusing a cached render."""
+    key = (category, price_list, get_catalogue_version(), page)
+    rows = grid_cache.get(key)
+    if rows is None:
+        start = page * GRID_PAGE_SIZE
+        rows = product_grid_rows(products[category][start:start + GRID_PAGE_SIZE], category, price_list)
+        grid_cache.set(key, rows)
+    return rows
 
-def product_buttons(products, category, event_pricing_active=False):
-    """Return a grid of product buttons for the given category."""
-    return create_product_grid(products, category, event_pricing_active)
+def load_more_text(shown, total):
+    """Label for a category's "Show more" button."""
+    return f"Show more ({shown} of {total})"
 
-def all_product_buttons(products, event_pricing_active=False):
+def load_more_style(shown, total):
+    """Hide a category's "Show more" button once every product is shown."""
+    return LOAD_MORE_STYLE if shown < total else {"display": "none"}
+
+def product_buttons(products, category, price_list=None):
+    """Return the first page of a category's product grid and a button to load more.
+
+    Further pages are appended to the category-grid by the load_more_products
+    callback, so the cost of showing a tab does not grow with the category.
+    """
+    total = len(products[category])
+    shown = min(total, GRID_PAGE_SIZE)
+    return [
+        html.Div(product_page(products, category, 0, price_list),
+                 id={"type": "category-grid", "category": category}, style={"width": "100%"}),
+        dbc.Button(
+            load_more_text(shown, total),
+            id={"type": "load-more", "category": category},
+            color="link",
+            size="sm",
+            n_clicks=0,
+            style=load_more_style(shown, total)
+        )
+    ]
+
+def all_product_buttons(products, price_list=None):
     """Return a grid of buttons for all products."""
-    return create_product_grid(products, "Home", event_pricing_active)
+    return create_product_grid(products, "Home", price_list)
 
-def popular_product_buttons(products, refresh_trigger=None, event_pricing_active=False):
+def popular_product_buttons(products, refresh_trigger=None, price_list=None):
     """Return a grid of buttons for popular products."""
     # Get popular products from database
     popular_products = get_popular_products(days=90, limit=15)
@@ -101,16 +175,16 @@ def popular_product_buttons(products, refresh_trigger=None, event_pricing_active
     # Create a dictionary with the popular products for the grid function
     popular_dict = {"Home": popular_products}
     
-    return create_product_grid(popular_dict, "Home", event_pricing_active)
+    return create_product_grid(popular_dict, "Home", price_list)
 
-def get_home_content(products, event_pricing_active=False):
+def get_home_content(products, price_list=None):
     """Get the content for the Home tab with popular products."""
     return html.Div(
         [
             html.H5("Most Popular Products", 
                    style={"marginBottom": "10px", "marginTop": "10px", "paddingLeft": "10px"}),
             html.Div(
-                popular_product_buttons(products, None, event_pricing_active),
+                popular_product_buttons(products, None, price_list),
                 id="popular-products-container"
             )
         ],
@@ -122,10 +196,15 @@ def get_home_content(products, event_pricing_active=False):
         }
     )
 
-def get_category_content(products, category, event_pricing_active=False):
-    """Get the content for a specific category tab."""
+def get_category_content(products, category, price_list=None, rendered=True):
+    """Get the content for a specific category tab.
+
+    With rendered=False an empty container is returned; its grid is filled in
+    by a callback the first time the tab is selected.
+    """
     return html.Div(
-        product_buttons(products, category, event_pricing_active),
+        product_buttons(products, category, price_list) if rendered else None,
+        id={"type": "category-content", "category": category},
         style={
             "padding": "5px",
             "overflowY": "auto",
@@ -134,17 +213,26 @@ def get_category_content(products, category, event_pricing_active=False):
         }
     )
 
-def get_layout(products, event_pricing_active=False):
-    """Return the complete Dash layout using the products data."""
+def search_result_buttons(results, price_list=None):
+    """Return a grid of buttons for search.SearchIndex results."""
+    if not results:
+        return html.Div("No matching products.", style={"padding": "5px 10px"})
+    items = [(p.name, p.price, p.sku, p.stock, p.id, p.event_price) for p in results]
+    return create_product_grid({"Search": items}, "Search", price_list)
+
+def category_tabs(products, price_list=None, selected="Home"):
+    """Return the dcc.Tab list: Home plus one lazily rendered tab per category."""
     # Create a separate function for each category's content to allow for tab refreshes
     category_contents = {
-        "Home": get_home_content(products, event_pricing_active)
+        "Home": get_home_content(products, price_list)
     }
     
-    # Add content for other categories
+    # Other categories start empty and are rendered when first selected
     for category in products.keys():
         if category != "Home":
-            category_contents[category] = get_category_content(products, category, event_pricing_active)
+            category_contents[category] = get_category_content(
+                products, category, price_list, rendered=(category == selected)
+            )
     
     # Custom tab style with smaller black font
     tab_style = {
@@ -170,6 +258,42 @@ def get_layout(products, event_pricing_active=False):
                 'fontWeight': 'bold'
             }
         ))
+    return tabs
+
+def price_list_pricing(price_list):
+    """Return how the client-side basket should price items on price_list.
+
+    None means standard prices; named lists send their markup and only the
+    overridden prices, not a price for every product.
+    """
+    if price_list == EVENT_PRICE_LIST:
+        return {"event": True}
+    details = get_price_list(price_list) if price_list is not None else None
+    if details is None:
+        return None
+    return {"markup": details["markup_percent"],
+            "overrides": {str(prod_id): price for prod_id, price in details["overrides"].items()}}
+
+def price_list_options(now=None):
+    """Return the price list dropdown options; lists outside their active window are disabled."""
+    return [
+        {"label": price_list["name"], "value": price_list["id"],
+         "disabled": not price_list_active(price_list, now)}
+        for price_list in get_price_lists()
+    ]
+
+def catalogue_state(products, catalogue_version):
+    """Return the catalogue-version store data a page was rendered with."""
+    return {"version": catalogue_version, "categories": [c for c in products if c != "Home"]}
+
+def get_layout(products, price_list=None, catalogue_version=0):
+    """Return the complete Dash layout using the products data.
+
+    No catalogue is shipped for the client-side basket: each product button
+    carries its own details and scanned SKUs are looked up by the server.
+    """
+    tabs = category_tabs(products, price_list)
+    event_pricing_active = price_list == EVENT_PRICE_LIST
 
     # Create event button independently to control position
     event_button = dbc.Button(
@@ -185,6 +309,17 @@ def get_layout(products, event_pricing_active=False):
         }
     )
 
+    # Named price lists (members, trade, happy hour...) picked per session
+    price_list_select = dcc.Dropdown(
+        id="price-list-select",
+        options=price_list_options(),
+        value=None if event_pricing_active else price_list,
+        placeholder="Standard prices",
+        clearable=True,
+        searchable=False,
+        style={"width": "220px"}
+    )
+
     # Create order placement button
     place_order_button = dbc.Button(
         "Place Order",
@@ -196,8 +331,18 @@ def get_layout(products, event_pricing_active=False):
     layout = dbc.Container(
         [
             dcc.Store(id="order-store", data=[]),
-            dcc.Store(id="event-pricing-active", data=event_pricing_active),  # Initialize with passed value
+            dcc.Store(id="price-list", data=price_list),  # None, "event" or a price list id
+            dcc.Store(id="effective-price-list", data=price_list),  # price-list as charged now (see db.effective_price_list)
+            dcc.Store(id="price-list-prices", data=price_list_pricing(price_list)),  # For the client-side basket
             dcc.Store(id="refresh-trigger", data=0),  # Added to trigger home screen refresh
+            dcc.Store(id="rendered-tabs", data=["Home"]),  # Categories whose grids have been sent
+            dcc.Store(id="product-tap"),  # {"product_id", "seq", "product"} of the last product tapped
+            dcc.Store(id="remove-tap"),  # {"index", "seq"} of the last remove button pressed
+            dcc.Store(id="scan-queue"),  # [[seq, sku], ...] scans the order may not have yet (assets/scanner.js)
+            dcc.Store(id="scan-applied", data=0),  # seq of the last scan added to the order
+            dcc.Store(id="scan-products"),  # {"scans", "products": {sku: basket_product}} from look_up_scans
+            dcc.Store(id="catalogue-version", data=catalogue_state(products, catalogue_version)),
+            dcc.Interval(id="catalogue-poll", interval=CATALOGUE_POLL_INTERVAL),  # Picks up catalogue edits
             
             # Main content row - products and order summary
             dbc.Row(
@@ -205,14 +350,26 @@ def get_layout(products, event_pricing_active=False):
                     # Left side - product tabs
                     # Increase product area width from 8 to 9 columns (out of 12 total)
                     dbc.Col(
-                        dcc.Tabs(
-                            id="category-tabs",
-                            value="Home",
-                            children=tabs,
-                            # Additional tab container styling
-                            style={'height': '44px'},  # Control overall tab bar height
-                            content_style={'padding': '0px'}  # Remove content padding
-                        ),
+                        [
+                            # Type-ahead search; the best matches show as buttons above the tabs
+                            dcc.Input(
+                                id="product-search",
+                                type="search",
+                                placeholder="Search name, SKU or category",
+                                debounce=SEARCH_DEBOUNCE,
+                                autoComplete="off",
+                                className="form-control form-control-sm mb-1"
+                            ),
+                            html.Div(id="search-results"),
+                            dcc.Tabs(
+                                id="category-tabs",
+                                value="Home",
+                                children=tabs,
+                                # Additional tab container styling
+                                style={'height': '44px'},  # Control overall tab bar height
+                                content_style={'padding': '0px'}  # Remove content padding
+                            ),
+                        ],
                         width=9,  # Changed from 8 to 9 (out of 12)
                         className="pe-1"
                     ),
@@ -222,6 +379,18 @@ def get_layout(products, event_pricing_active=False):
                     dbc.Col(
                         html.Div(
                             [
+                                # Barcode scanner field; scans are queued by assets/scanner.js
+                                dcc.Input(
+                                    id="scan-input",
+                                    type="text",
+                                    placeholder="Scan barcode",
+                                    debounce=True,
+                                    autoFocus=True,
+                                    autoComplete="off",
+                                    className="form-control form-control-sm mb-1"
+                                ),
+                                html.Div(id="scan-message", className="small text-danger"),
+
                                 # Order header and list
                                 html.Div([
                                     # Simple header bar - all in one row
@@ -295,6 +464,9 @@ def get_layout(products, event_pricing_active=False):
                                     ],
                                     className="mt-2"
                                 ),
+
+                                # Checkout problems such as insufficient stock
+                                html.Div(id="order-message", className="mt-2"),
                             ]
                         ),
                         width=3,  # Changed from 4 to 3 (out of 12)
@@ -314,8 +486,14 @@ def get_layout(products, event_pricing_active=False):
                         width={"size": 1, "offset": 0},
                         className="mt-2"
                     ),
+                    # Price list picker next to it
+                    dbc.Col(
+                        price_list_select,
+                        width={"size": 3, "offset": 0},
+                        className="mt-2"
+                    ),
                     # Empty space
-                    dbc.Col(width=11)
+                    dbc.Col(width=8)
                 ],
                 className="mt-2"
             ),
@@ -0,0 +1,96 @@
+"""The serialized initial page layout, kept in memory and on disk.
+
+Building the page's layout renders the Home grid and the first category
+tab and runs the best-sellers query; turning it into JSON costs as much
+again. The JSON is cached under a key made from everything it shows: the
+catalogue (version and a checksum of the products), the best sellers, the
+price list choices and the code that renders it. A restarted till finds
+the page it served last time on disk.
+"""
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import sys
+import threading
+
+import dash
+import dash_bootstrap_components as dbc
+
+from db import get_popular_products
+from layout import price_list_options
+
+LAYOUT_CACHE_DIR = "layout_cache"
+
+
+def _code_fingerprint():
+    """Identify the code that renders layouts, so an upgrade never serves an old page."""
+    if getattr(sys, "frozen", False):
+        paths = [sys.executable]  # PyInstaller bundle: the code is inside the executable
+    else:
+        paths = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py")))
+    stamps = []
+    for path in paths:
+        stat = os.stat(path)
+        stamps.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+    return [dash.__version__, dbc.__version__, stamps]
+
+
+_CODE_FINGERPRINT = _code_fingerprint()
+
+
+def initial_layout_key(snapshot):
+    """Return the cache key for the initial page shown for a catalogue.CatalogueSnapshot."""
+    parts = [_CODE_FINGERPRINT, snapshot.version, snapshot.checksum,
+             get_popular_products(days=90, limit=15), price_list_options()]
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:20]
+
+
+class LayoutCache:
+    """The JSON of the most recent initial layout, in memory and in directory."""
+
+    def __init__(self, directory=LAYOUT_CACHE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._key = None
+        self._json = None
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"layout-{key}.json")
+
+    def get(self, key, build):
+        """Return the layout JSON for key, calling build() for the layout only when it is not cached."""
+        with self._lock:
+            if key == self._key:
+                return self._json
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            if data is None:
+                # Serialized the same way Dash serves a layout; plotly.io is only
+                # imported when a layout is actually built
+                from plotly.io.json import to_json_plotly
+                data = to_json_plotly(build()).encode("utf-8")
+                self._write(key, data)
+            self._key, self._json = key, data
+            return data
+
+    def _write(self, key, data):
+        """Save data for key, replacing the layouts saved for older keys."""
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            for old_path in glob.glob(os.path.join(self.directory, "layout-*.json")):
+                if old_path != path:
+                    with contextlib.suppress(FileNotFoundError):  # another worker got there first
+                        os.remove(old_path)
+        except OSError as e:
+            # The page is still served from memory; only the next restart is slower
+            print(f"Error saving layout cache {path}: {e}")
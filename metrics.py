@@ -0,0 +1,263 @@
+"""In-process metrics for the POS, served in Prometheus text format.
+
+Dash callbacks are timed per request to /_dash-update-component, with the
+request and response payload sizes and the number of SQL statements they
+ran. db.py functions decorated with @timed record their own latency.
+Everything is kept in memory per process; scrape /metrics, e.g.
+
+    histogram_quantile(0.95, rate(pos_callback_duration_seconds_bucket[5m]))
+"""
+import bisect
+import functools
+import threading
+import time
+
+# Histogram buckets: seconds for latencies, bytes for payloads, counts for SQL
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+CALLBACK_PATH = "/_dash-update-component"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            yield self.name, list(zip(self.labels, key)), value
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in sorted(items):
+            labels = list(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                yield self.name + "_bucket", labels + [("le", le)], cumulative
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+
+class Gauge:
+    """A value read from a function each time metrics are rendered."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self):
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"Error reading metric {self.name}: {e}")
+            return
+        if value is not None:
+            yield self.name, [], value
+
+
+class StartupTimer:
+    """Seconds spent in each phase of process start-up, served as a gauge per phase."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, started=None):
+        self.name = name
+        self.help = help
+        self.phases = []
+        self._last = time.perf_counter() if started is None else started
+
+    def phase(self, phase):
+        """Record the time since the previous phase ended (or since started) as phase."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def samples(self):
+        for phase, seconds in self.phases:
+            yield self.name, [("phase", phase)], seconds
+
+    def report(self):
+        """Return the phases and their total as lines of text for the console."""
+        width = max([len(phase) for phase, _ in self.phases] + [len("total")])
+        lines = [f"  {phase:<{width}} {seconds * 1000:8.1f} ms" for phase, seconds in self.phases]
+        lines.append(f"  {'total':<{width}} {sum(seconds for _, seconds in self.phases) * 1000:8.1f} ms")
+        return "Start-up timing:\n" + "\n".join(lines)
+
+
+_metrics = []
+
+
+def register(metric):
+    """Add a metric to the /metrics output and return it."""
+    _metrics.append(metric)
+    return metric
+
+
+def gauge(name, help, read):
+    """Register a gauge whose value is read() at scrape time."""
+    return register(Gauge(name, help, read))
+
+
+def render():
+    """Return every registered metric in Prometheus text exposition format."""
+    lines = []
+    for metric in list(_metrics):
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+CALLBACK_SECONDS = register(Histogram(
+    "pos_callback_duration_seconds", "Time to handle a Dash callback request", ("callback",)))
+CALLBACK_REQUEST_BYTES = register(Histogram(
+    "pos_callback_request_bytes", "Size of Dash callback request bodies", ("callback",), SIZE_BUCKETS))
+CALLBACK_RESPONSE_BYTES = register(Histogram(
+    "pos_callback_response_bytes", "Size of Dash callback responses", ("callback",), SIZE_BUCKETS))
+CALLBACK_SQL_STATEMENTS = register(Histogram(
+    "pos_callback_sql_statements", "SQL statements run by one Dash callback request", ("callback",), COUNT_BUCKETS))
+CALLBACK_ERRORS = register(Counter(
+    "pos_callback_errors_total", "Dash callback requests answered with a server error", ("callback",)))
+DB_SECONDS = register(Histogram(
+    "pos_db_call_duration_seconds", "Time spent in db.py functions", ("function",)))
+DB_ERRORS = register(Counter(
+    "pos_db_call_errors_total", "db.py calls that raised", ("function",)))
+SQL_STATEMENTS = register(Counter(
+    "pos_sql_statements_total", "SQL statements run on pooled connections"))
+
+# SQL statements run by the current thread since it last called start_sql_count()
+_local = threading.local()
+
+
+def count_statement(statement):
+    """sqlite3 trace callback: count each statement against the current thread."""
+    if statement.startswith("--"):
+        return  # statements run by triggers are reported as comments
+    SQL_STATEMENTS.inc()
+    _local.sql_count = getattr(_local, "sql_count", 0) + 1
+
+
+def start_sql_count():
+    _local.sql_count = 0
+
+
+def sql_count():
+    return getattr(_local, "sql_count", 0)
+
+
+def timed(func):
+    """Record a function's latency (and any exception) under its name."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc(function=name)
+            raise
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - start, function=name)
+    return wrapper
+
+
+def instrument_app(app):
+    """Time app's callbacks and serve the collected metrics at /metrics."""
+    from flask import Response, g, request
+
+    server = app.server
+
+    def callback_name(output):
+        callback = app.callback_map.get(output, {}).get("callback")
+        return getattr(callback, "__name__", output)
+
+    @server.before_request
+    def start_callback_timer():
+        if request.path.endswith(CALLBACK_PATH):
+            g.metrics_start = time.perf_counter()
+            start_sql_count()
+
+    @server.after_request
+    def record_callback(response):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return response
+        body = request.get_json(silent=True) or {}
+        name = callback_name(body.get("output", "unknown"))
+        CALLBACK_SECONDS.observe(time.perf_counter() - start, callback=name)
+        CALLBACK_REQUEST_BYTES.observe(request.content_length or 0, callback=name)
+        CALLBACK_RESPONSE_BYTES.observe(response.calculate_content_length() or 0, callback=name)
+        CALLBACK_SQL_STATEMENTS.observe(sql_count(), callback=name)
+        if response.status_code >= 500:
+            CALLBACK_ERRORS.inc(callback=name)
+        return response
+
+    @server.route("/metrics")
+    def metrics_endpoint():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
+
+    return app
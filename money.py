@@ -0,0 +1,33 @@
+"""Money helpers: every price and total in the POS is an integer number of pence."""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Event pricing adds this percentage to the normal price
+EVENT_MARKUP_PERCENT = 10
+
+
+def to_pence(value):
+    """Parse a price in pounds (e.g. "2.75" or 2.75) into integer pence, rounding half up."""
+    try:
+        pounds = Decimal(str(value).strip().lstrip("£"))
+    except InvalidOperation:
+        raise ValueError(f"invalid price {value!r}")
+    if not pounds.is_finite():
+        raise ValueError(f"invalid price {value!r}")
+    return int((pounds * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def apply_markup(pence, markup_percent):
+    """Add markup_percent (negative for a discount) to a price, rounded half up to a whole penny."""
+    return (pence * (100 + markup_percent) + 50) // 100
+
+
+def event_price(pence, markup_percent=EVENT_MARKUP_PERCENT):
+    """Return the event price for a normal price."""
+    return apply_markup(pence, markup_percent)
+
+
+def format_pence(pence):
+    """Format integer pence as pounds, e.g. 1234 -> "£12.34"."""
+    sign = "-" if pence < 0 else ""
+    pence = abs(pence)
+    return f"{sign}£{pence // 100}.{pence % 100:02d}"
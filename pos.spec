@@ -3,7 +3,7 @@
 block_cipher = None
 
 a = Analysis(
-    ['app.py'],
+    ['serve.py'],
     pathex=[],
     binaries=[],
     datas=[
@@ -15,12 +15,14 @@ a = Analysis(
         'dash',
         'dash_bootstrap_components',
         'sqlite3',
-        'pandas'
+        'app',
+        'waitress'
     ],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Not used by the POS; leaving them out keeps the bundle small and quick to unpack
+    excludes=['pandas', 'numpy', 'pyarrow', 'sqlalchemy', 'IPython'],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
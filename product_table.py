@@ -0,0 +1,139 @@
+"""Column-oriented catalogue returned by db.get_products().
+
+A ProductTable reads like the {category: [(name, price, sku, stock, id,
+event_price), ...]} dict the layout was written against, with "Home" listing
+every product, but holds one entry per product in parallel columns instead
+of a tuple per product listed twice. The category lists and "Home" are
+ProductRows views over row ranges; tuples are only made while iterating.
+"""
+import hashlib
+from array import array
+from bisect import bisect_right
+from collections.abc import Mapping, Sequence
+
+HOME = "Home"
+
+
+class ProductRows(Sequence):
+    """A run of table rows, seen as (name, price, sku, stock, id, event_price) tuples."""
+
+    __slots__ = ("_table", "_start", "_stop")
+
+    def __init__(self, table, start, stop):
+        self._table = table
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            return ProductRows(self._table, self._start + start, self._start + max(start, stop))
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("product row out of range")
+        return self._table.row(self._start + i)
+
+    def __iter__(self):
+        table, start, stop = self._table, self._start, self._stop
+        return zip(table.names[start:stop], table.prices[start:stop], table.skus[start:stop],
+                   table.stocks[start:stop], table.ids[start:stop], table.event_prices[start:stop])
+
+    def __repr__(self):
+        return f"ProductRows({self._start}:{self._stop})"
+
+
+class ProductTable(Mapping):
+    """The products as parallel columns, grouped by category; never modified once built.
+
+    Prices are integer pence. Maps each category, and "Home" for every
+    product, to a ProductRows view.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.skus = []
+        self.prices = array("q")
+        self.event_prices = array("q")
+        self.stocks = array("q")
+        self.ids = array("q")
+        self._ranges = {}      # category -> (start, stop) rows
+        self._starts = []      # first row of each category, in row order
+        self._categories = []  # category names, in row order
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a table in one pass over (category, name, price, sku, stock, id, event_price) rows.
+
+        rows may be a database cursor; they must come grouped by category
+        and sorted by name within it, as db.get_products() selects them.
+        """
+        table = cls()
+        names, skus = table.names, table.skus
+        prices, event_prices, stocks, ids = table.prices, table.event_prices, table.stocks, table.ids
+        current = None
+        for category, name, price, sku, stock, prod_id, event_price in rows:
+            if category != current:
+                if category in table._ranges:
+                    raise ValueError(f"rows for category {category!r} are not together")
+                table._start_category(category, len(ids))
+                current = category
+            names.append(name)
+            skus.append(sku)
+            prices.append(price)
+            event_prices.append(event_price)
+            stocks.append(stock or 0)
+            ids.append(prod_id)
+        if current is not None:
+            table._ranges[current] = (table._starts[-1], len(ids))
+        return table
+
+    def _start_category(self, category, row):
+        if self._categories:
+            self._ranges[self._categories[-1]] = (self._starts[-1], row)
+        self._categories.append(category)
+        self._starts.append(row)
+        self._ranges[category] = (row, row)
+
+    def __getitem__(self, category):
+        if category == HOME:
+            return ProductRows(self, 0, len(self.ids))
+        start, stop = self._ranges[category]
+        return ProductRows(self, start, stop)
+
+    def __iter__(self):
+        yield HOME
+        # A category that is itself called "Home" is only reachable as part of Home
+        yield from (category for category in self._categories if category != HOME)
+
+    def __len__(self):
+        return len(self._categories) + 1
+
+    def row(self, i):
+        """Return row i as a (name, price, sku, stock, id, event_price) tuple."""
+        return (self.names[i], self.prices[i], self.skus[i], self.stocks[i], self.ids[i],
+                self.event_prices[i])
+
+    def category_at(self, i):
+        """Return the category of row i."""
+        return self._categories[bisect_right(self._starts, i) - 1]
+
+    def category_range(self, category):
+        """Return the (start, stop) rows of a category, or None."""
+        return self._ranges.get(category)
+
+    def checksum(self):
+        """Return a digest of every row, for caches kept outside the process."""
+        digest = hashlib.sha1()
+        for text in (self._categories, self.names, [sku or "" for sku in self.skus]):
+            digest.update("\0".join(text).encode("utf-8", "surrogatepass"))
+            digest.update(b"\1")
+        digest.update(array("q", self._starts).tobytes())
+        for column in (self.prices, self.event_prices, self.stocks, self.ids):
+            digest.update(column.tobytes())
+        return digest.hexdigest()
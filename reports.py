@@ -0,0 +1,407 @@
+"""Sales reports: Z-reports, period summaries and streaming exports.
+
+Reports read rollup tables rather than the raw sales log:
+report_product_daily and report_product_monthly (quantity and takings per
+product per day and per month) and report_hourly (orders, items and
+takings per hour). They are caught up incrementally from product_sales and
+orders, using the last id rolled up from each, so only sales recorded since
+the previous report are read. A period's product totals come from whole
+months plus the odd days at either end. Days and hours are local time.
+
+    python reports.py z --day 2026-10-17
+    python reports.py summary --by category --from 2026-01-01 --to 2026-12-31
+    python reports.py export sales.parquet --from 2026-10-01 --to 2026-10-31
+
+Money is integer pence throughout. Parquet export needs pyarrow.
+"""
+import argparse
+import csv
+from datetime import date, datetime, timedelta
+
+import db
+from metrics import timed
+from money import format_pence
+
+# Rows fetched (and written) at a time when exporting
+EXPORT_CHUNK_SIZE = 10000
+
+# Product rows shown on a Z-report
+Z_REPORT_TOP_PRODUCTS = 10
+
+# Raw sales lines with what was sold, in local time
+LINES_QUERY = """
+    SELECT s.id, s.order_id, datetime(s.sale_date, 'localtime'), s.product_id,
+           p.sku, c.name, p.name, s.quantity, s.unit_price_pence,
+           s.quantity * COALESCE(s.unit_price_pence, 0)
+    FROM product_sales s
+    LEFT JOIN products p ON p.id = s.product_id
+    LEFT JOIN categories c ON c.id = p.category_id
+    WHERE s.sale_date >= datetime(?, 'utc') AND s.sale_date < datetime(?, '+1 day', 'utc')
+    ORDER BY s.id
+"""
+LINES_COLUMNS = [("sale_id", "int"), ("order_id", "int"), ("sold_at", "str"), ("product_id", "int"),
+                 ("sku", "str"), ("category", "str"), ("product", "str"), ("quantity", "int"),
+                 ("unit_price_pence", "int"), ("line_total_pence", "int")]
+
+CATEGORY_COLUMNS = [("category", "str"), ("quantity", "int"), ("revenue_pence", "int")]
+PRODUCT_COLUMNS = [("product_id", "int"), ("sku", "str"), ("category", "str"), ("product", "str"),
+                   ("quantity", "int"), ("revenue_pence", "int")]
+HOUR_COLUMNS = [("hour", "int"), ("orders", "int"), ("items", "int"), ("revenue_pence", "int")]
+DAY_COLUMNS = [("day", "str"), ("orders", "int"), ("items", "int"), ("revenue_pence", "int")]
+
+# Rolls new sales lines into the per-product daily totals
+PRODUCT_DAILY_ROLLUP = """
+    INSERT INTO report_product_daily (day, product_id, quantity, revenue_pence)
+    SELECT date(sale_date, 'localtime'), product_id, SUM(quantity),
+           SUM(quantity * COALESCE(unit_price_pence, 0))
+    FROM product_sales
+    WHERE id > ? AND id <= ?
+    GROUP BY 1, 2
+    ON CONFLICT (day, product_id) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        revenue_pence = revenue_pence + excluded.revenue_pence
+"""
+PRODUCT_MONTHLY_ROLLUP = """
+    INSERT INTO report_product_monthly (month, product_id, quantity, revenue_pence)
+    SELECT strftime('%Y-%m', sale_date, 'localtime'), product_id, SUM(quantity),
+           SUM(quantity * COALESCE(unit_price_pence, 0))
+    FROM product_sales
+    WHERE id > ? AND id <= ?
+    GROUP BY 1, 2
+    ON CONFLICT (month, product_id) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        revenue_pence = revenue_pence + excluded.revenue_pence
+"""
+HOURLY_SALES_ROLLUP = """
+    INSERT INTO report_hourly (day, hour, items, revenue_pence)
+    SELECT date(sale_date, 'localtime'), CAST(strftime('%H', sale_date, 'localtime') AS INTEGER),
+           SUM(quantity), SUM(quantity * COALESCE(unit_price_pence, 0))
+    FROM product_sales
+    WHERE id > ? AND id <= ?
+    GROUP BY 1, 2
+    ON CONFLICT (day, hour) DO UPDATE SET
+        items = items + excluded.items,
+        revenue_pence = revenue_pence + excluded.revenue_pence
+"""
+HOURLY_ORDERS_ROLLUP = """
+    INSERT INTO report_hourly (day, hour, orders)
+    SELECT date(created_at, 'localtime'), CAST(strftime('%H', created_at, 'localtime') AS INTEGER), COUNT(*)
+    FROM orders
+    WHERE id > ? AND id <= ?
+    GROUP BY 1, 2
+    ON CONFLICT (day, hour) DO UPDATE SET orders = orders + excluded.orders
+"""
+
+# source table -> the rollup statements fed from it
+ROLLUPS = {
+    "product_sales": (PRODUCT_DAILY_ROLLUP, PRODUCT_MONTHLY_ROLLUP, HOURLY_SALES_ROLLUP),
+    "orders": (HOURLY_ORDERS_ROLLUP,),
+}
+
+
+def _day(value):
+    """Return a date, datetime or 'YYYY-MM-DD' string as 'YYYY-MM-DD'; None means today."""
+    if value is None:
+        return date.today().isoformat()
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+
+
+def _period(start, end):
+    start = _day(start)
+    return start, _day(end) if end is not None else start
+
+
+# Per-product totals for a period: whole months from the monthly rollup, the
+# days before the first and after the last whole month from the daily one.
+# Takes the (start, end) pairs returned by _split_period()
+PRODUCT_TOTALS = """
+    SELECT product_id, SUM(quantity) AS quantity, SUM(revenue_pence) AS revenue_pence
+    FROM (
+        SELECT product_id, quantity, revenue_pence FROM report_product_daily WHERE day BETWEEN ? AND ?
+        UNION ALL
+        SELECT product_id, quantity, revenue_pence FROM report_product_monthly WHERE month BETWEEN ? AND ?
+        UNION ALL
+        SELECT product_id, quantity, revenue_pence FROM report_product_daily WHERE day BETWEEN ? AND ?
+    )
+    GROUP BY product_id
+"""
+
+
+def _split_period(start, end):
+    """Split start..end into leading days, whole months and trailing days.
+
+    Returns six query parameters for PRODUCT_TOTALS; a part that is not
+    needed is (None, None), which matches nothing.
+    """
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    # First day of the first whole month, and first day of the month after the last whole one
+    month_start = first if first.day == 1 else _next_month(first)
+    month_end = _next_month(last) if _next_month(last) - timedelta(days=1) == last else last.replace(day=1)
+    if month_start >= month_end:
+        return (start, end, None, None, None, None)
+    head = (start, (month_start - timedelta(days=1)).isoformat()) if first < month_start else (None, None)
+    tail = (month_end.isoformat(), end) if month_end <= last else (None, None)
+    months = (month_start.strftime("%Y-%m"), (month_end - timedelta(days=1)).strftime("%Y-%m"))
+    return head + months + tail
+
+
+def _next_month(day):
+    """Return the first day of the month after day's."""
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def _watermarks(conn):
+    latest = {source: conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {source}").fetchone()[0]
+              for source in ROLLUPS}
+    rolled = dict(conn.execute("SELECT source, last_id FROM report_watermarks"))
+    return latest, {source: rolled.get(source, 0) for source in ROLLUPS}
+
+
+@timed
+def refresh_rollups():
+    """Roll sales recorded since the last refresh into the report tables.
+
+    Returns the number of new sales lines rolled up. When nothing new has
+    been recorded this is two index lookups and no write.
+    """
+    with db.get_db_connection() as conn:
+        latest, rolled = _watermarks(conn)
+        if latest == rolled:
+            return 0
+        conn.execute("BEGIN IMMEDIATE")
+        # Re-read under the write lock in case another process caught up first
+        latest, rolled = _watermarks(conn)
+        for source, statements in ROLLUPS.items():
+            if latest[source] == rolled[source]:
+                continue
+            for statement in statements:
+                conn.execute(statement, (rolled[source], latest[source]))
+            conn.execute("""
+                INSERT INTO report_watermarks (source, last_id) VALUES (?, ?)
+                ON CONFLICT (source) DO UPDATE SET last_id = excluded.last_id
+            """, (source, latest[source]))
+        return latest["product_sales"] - rolled["product_sales"]
+
+
+@timed
+def sales_by_category(start=None, end=None):
+    """Return [(category, quantity, revenue_pence)] for the days start..end inclusive, best first."""
+    start, end = _period(start, end)
+    refresh_rollups()
+    with db.get_db_connection() as conn:
+        return conn.execute(f"""
+            SELECT COALESCE(c.name, 'Deleted products'), SUM(t.quantity), SUM(t.revenue_pence)
+            FROM ({PRODUCT_TOTALS}) t
+            LEFT JOIN products p ON p.id = t.product_id
+            LEFT JOIN categories c ON c.id = p.category_id
+            GROUP BY 1
+            ORDER BY 3 DESC, 1
+        """, _split_period(start, end)).fetchall()
+
+
+@timed
+def sales_by_product(start=None, end=None, limit=None):
+    """Return [(product_id, sku, category, name, quantity, revenue_pence)] for start..end, best first."""
+    start, end = _period(start, end)
+    refresh_rollups()
+    with db.get_db_connection() as conn:
+        return conn.execute(f"""
+            SELECT t.product_id, p.sku, c.name, COALESCE(p.name, 'Deleted product #' || t.product_id),
+                   t.quantity, t.revenue_pence
+            FROM ({PRODUCT_TOTALS}) t
+            LEFT JOIN products p ON p.id = t.product_id
+            LEFT JOIN categories c ON c.id = p.category_id
+            ORDER BY t.revenue_pence DESC, t.quantity DESC, t.product_id
+            LIMIT ?
+        """, _split_period(start, end) + (-1 if limit is None else limit,)).fetchall()
+
+
+@timed
+def sales_by_hour(start=None, end=None):
+    """Return [(hour, orders, items, revenue_pence)] for each hour of the day that had sales in start..end."""
+    start, end = _period(start, end)
+    refresh_rollups()
+    with db.get_db_connection() as conn:
+        return conn.execute("""
+            SELECT hour, SUM(orders), SUM(items), SUM(revenue_pence)
+            FROM report_hourly
+            WHERE day BETWEEN ? AND ?
+            GROUP BY hour
+            ORDER BY hour
+        """, (start, end)).fetchall()
+
+
+@timed
+def sales_by_day(start=None, end=None):
+    """Return [(day, orders, items, revenue_pence)] for each trading day in start..end."""
+    start, end = _period(start, end)
+    refresh_rollups()
+    with db.get_db_connection() as conn:
+        return conn.execute("""
+            SELECT day, SUM(orders), SUM(items), SUM(revenue_pence)
+            FROM report_hourly
+            WHERE day BETWEEN ? AND ?
+            GROUP BY day
+            ORDER BY day
+        """, (start, end)).fetchall()
+
+
+def period_summary(start=None, end=None):
+    """Return the totals and category, product and hour breakdowns for start..end as a dict."""
+    start, end = _period(start, end)
+    days = sales_by_day(start, end)
+    orders = sum(row[1] for row in days)
+    takings = sum(row[3] for row in days)
+    return {
+        "start": start,
+        "end": end,
+        "orders": orders,
+        "items": sum(row[2] for row in days),
+        "takings_pence": takings,
+        "average_order_pence": (takings + orders // 2) // orders if orders else 0,
+        "days": days,
+        "categories": sales_by_category(start, end),
+        "products": sales_by_product(start, end),
+        "hours": sales_by_hour(start, end),
+    }
+
+
+def z_report(day=None):
+    """Return the end-of-day (Z) report for one trading day, today by default."""
+    report = period_summary(day, day)
+    report["day"] = report["start"]
+    report["products"] = report["products"][:Z_REPORT_TOP_PRODUCTS]
+    return report
+
+
+def format_z_report(report):
+    """Render a z_report() as printable text."""
+    lines = [
+        f"Z-REPORT {report['day']}",
+        f"Orders:        {report['orders']}",
+        f"Items sold:    {report['items']}",
+        f"Takings:       {format_pence(report['takings_pence'])}",
+        f"Average order: {format_pence(report['average_order_pence'])}",
+        "",
+        "By category:",
+    ]
+    lines += [f"  {name:<24} {quantity:>6}  {format_pence(revenue):>10}"
+              for name, quantity, revenue in report["categories"]]
+    lines += ["", "Top products:"]
+    lines += [f"  {name:<24} {quantity:>6}  {format_pence(revenue):>10}"
+              for _, _, _, name, quantity, revenue in report["products"]]
+    lines += ["", "By hour:"]
+    lines += [f"  {hour:02d}:00  {orders:>5} orders  {items:>6} items  {format_pence(revenue):>10}"
+              for hour, orders, items, revenue in report["hours"]]
+    return "\n".join(lines)
+
+
+def iter_sales_lines(start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the raw sales lines for start..end in lists of up to chunk_size rows (see LINES_COLUMNS)."""
+    start, end = _period(start, end)
+    with db.get_db_connection() as conn:
+        cur = conn.execute(LINES_QUERY, (start, end))
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+
+
+def _report_chunks(report, start, end, chunk_size):
+    """Return (columns, chunks) for one of the exportable reports."""
+    if report == "lines":
+        return LINES_COLUMNS, iter_sales_lines(start, end, chunk_size)
+    summaries = {
+        "category": (CATEGORY_COLUMNS, sales_by_category),
+        "product": (PRODUCT_COLUMNS, sales_by_product),
+        "hour": (HOUR_COLUMNS, sales_by_hour),
+        "day": (DAY_COLUMNS, sales_by_day),
+    }
+    if report not in summaries:
+        raise ValueError(f"unknown report {report!r}")
+    columns, query = summaries[report]
+    # Summaries come from the rollups and are small enough to write in one go
+    return columns, iter([query(start, end)])
+
+
+def _write_csv(path, columns, chunks):
+    written = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, _ in columns])
+        for rows in chunks:
+            writer.writerows(rows)
+            written += len(rows)
+    return written
+
+
+def _write_parquet(path, columns, chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"int": pa.int64(), "str": pa.string()}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in chunks:
+            # One row group per chunk, so memory stays bounded by chunk_size
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            written += len(rows)
+    return written
+
+
+@timed
+def export_report(path, report="lines", start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream a report for start..end to a .csv or .parquet file; returns the number of rows written.
+
+    report is "lines" (every sale line) or one of the "category", "product",
+    "hour" and "day" summaries.
+    """
+    columns, chunks = _report_chunks(report, start, end, chunk_size)
+    if str(path).lower().endswith(".parquet"):
+        return _write_parquet(path, columns, chunks)
+    return _write_csv(path, columns, chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POS sales reports")
+    parser.add_argument("--db", default=db.DB_FILE, help="database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    z = commands.add_parser("z", help="print the end-of-day report")
+    z.add_argument("--day", help="trading day as YYYY-MM-DD (default today)")
+
+    summary = commands.add_parser("summary", help="print a period summary")
+    summary.add_argument("--by", choices=["category", "product", "hour", "day"], default="category")
+
+    export = commands.add_parser("export", help="write a report to .csv or .parquet")
+    export.add_argument("path")
+    export.add_argument("--report", choices=["lines", "category", "product", "hour", "day"], default="lines")
+
+    for command in (summary, export):
+        command.add_argument("--from", dest="start", help="first day as YYYY-MM-DD (default today)")
+        command.add_argument("--to", dest="end", help="last day as YYYY-MM-DD (default the first day)")
+    args = parser.parse_args()
+
+    db.DB_FILE = args.db
+    db.init_db()
+    if args.command == "z":
+        print(format_z_report(z_report(args.day)))
+    elif args.command == "summary":
+        columns, chunks = _report_chunks(args.by, args.start, args.end, EXPORT_CHUNK_SIZE)
+        print("\t".join(name for name, _ in columns))
+        for rows in chunks:
+            for row in rows:
+                print("\t".join(format_pence(value) if name == "revenue_pence" else str(value)
+                                for (name, _), value in zip(columns, row)))
+    else:
+        written = export_report(args.path, args.report, args.start, args.end)
+        print(f"Wrote {written} rows to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Write-behind recording of checkouts.
+
+"Place Order" only has to wait for a stock check and an fsynced append to
+a local journal; a background thread then records the queued checkouts in
+SQLite in batches, one transaction per batch. Entries stay in the journal until
+their batch has committed. Only one process may own the journal: start()
+takes an exclusive lock on it and then records whatever a crash left behind.
+"""
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import db
+from journal import Journal
+
+# Journal the checkouts wait in until they are in the database
+JOURNAL_FILE = "sales.journal"
+# Most checkouts recorded in one transaction
+BATCH_SIZE = 200
+# Seconds to wait before retrying a batch the database refused
+RETRY_DELAY = 1.0
+
+
+def _record_batch(batch):
+    """Record journal entries in one transaction; returns how many were recorded.
+
+    Each checkout carries a ref stored as its client_ref, so an entry whose
+    batch committed just before a crash is not recorded twice on replay.
+    Raises RuntimeError, rolling the whole batch back, if any checkout
+    could not be recorded, so that it stays in the journal to be retried.
+    """
+    recorded = 0
+    with db.get_db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for _, entry in batch:
+            lines = [tuple(line) for line in entry["lines"]]
+            if not any(quantity > 0 for _, quantity, _ in lines):
+                continue  # nothing to record
+            # The customer has already paid, so stock is allowed to run negative
+            if db.record_order(lines, client_ref=entry["ref"], check_stock=False,
+                               taken_at=entry["taken_at"]) is None:
+                raise RuntimeError(f"checkout {entry['ref']} could not be recorded")
+            recorded += 1
+    return recorded
+
+
+def _lock_journal(journal_path):
+    """Take an exclusive lock on a journal; returns the open lock file, or None if another process has it."""
+    lock_file = open(journal_path + ".lock", "a+")
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+class SaleWriter:
+    """Queues checkouts in a journal and records them in SQLite from a background thread."""
+
+    def __init__(self, journal_path=None, batch_size=BATCH_SIZE):
+        self.journal_path = journal_path or JOURNAL_FILE
+        self.journal = None  # opened by start(), once this process owns it
+        self.batch_size = batch_size
+        self.flushed = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._total_latency = 0.0
+        self._latency_count = 0
+        # Quantities journaled but not yet written, which the stock in the database
+        # does not show yet. The writer only takes the lock to settle them once a
+        # batch has committed, never across the write itself
+        self._queued = {}
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._wake = threading.Event()
+        self._flushed = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Take the journal, record what a previous run left in it and start the writer thread.
+
+        Raises RuntimeError if another process already owns the journal.
+        """
+        self._lock_file = _lock_journal(self.journal_path)
+        if self._lock_file is None:
+            raise RuntimeError(f"{self.journal_path} is in use by another process")
+        self.journal = Journal(self.journal_path)
+        self._replay()
+        for _, entry in self.journal.pending():
+            self._add_queued(entry, 1)
+        self._thread = threading.Thread(target=self._run, name="sale-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def _replay(self):
+        """Record checkouts a previous run journaled but did not write."""
+        batch = self.journal.pending()
+        if not batch:
+            return
+        try:
+            recorded = _record_batch(batch)
+        except Exception as e:
+            # Left in the journal for the writer thread to retry
+            print(f"Error recovering unflushed checkouts from {self.journal.path}: {e}")
+            return
+        self.journal.ack(batch[-1][0])
+        print(f"Recovered {recorded} unflushed checkout(s) from {self.journal.path}")
+
+    def stop(self, timeout=5.0):
+        """Record what is queued, then stop the writer thread."""
+        self.flush(timeout)
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self.journal is not None:
+            self.journal.close()
+        if self._lock_file is not None:
+            self._lock_file.close()  # releases the lock
+            self._lock_file = None
+
+    def _add_queued(self, entry, sign):
+        for product_id, quantity, _ in entry["lines"]:
+            self._queued[product_id] = self._queued.get(product_id, 0) + sign * quantity
+            if not self._queued[product_id]:
+                del self._queued[product_id]
+
+    def submit(self, order_lines):
+        """Queue a checkout and return its ref once it is safely on disk.
+
+        order_lines is an iterable of (product_id, quantity, unit_price)
+        tuples, as taken by db.record_order. Raises db.OutOfStockError, and
+        queues nothing, if the stock left after the checkouts already queued
+        does not cover it.
+        """
+        entry = {
+            "ref": uuid.uuid4().hex,
+            "taken_at": time.time(),
+            "lines": [list(line) for line in order_lines],
+        }
+        wanted = {}
+        for product_id, quantity, _ in entry["lines"]:
+            wanted[product_id] = wanted.get(product_id, 0) + quantity
+        with self._lock:
+            # A WAL read, so a write in progress elsewhere does not hold it up
+            stock = db.get_stock_levels(wanted)
+            short = [product_id for product_id, quantity in wanted.items()
+                     if stock.get(product_id, 0) - self._queued.get(product_id, 0) < quantity]
+            if short:
+                raise db.OutOfStockError(short)
+            self.journal.append(entry)
+            self._add_queued(entry, 1)
+        self._wake.set()
+        return entry["ref"]
+
+    def flush(self, timeout=None):
+        """Wait until every queued checkout has been recorded; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._wake.set()
+        with self._flushed:
+            while len(self.journal):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._flushed.wait(remaining)
+        return True
+
+    def _write_pending(self):
+        """Record queued checkouts batch by batch; returns False if the database refused one."""
+        while True:
+            batch = self.journal.pending(self.batch_size)
+            if not batch:
+                return True
+            try:
+                self.flushed += _record_batch(batch)
+            except Exception as e:
+                print(f"Error writing queued sales: {e}")
+                self.errors += 1
+                return False
+            done = time.time()
+            # Until this runs a checkout may see the batch both in the stock and in
+            # _queued, which can only refuse a sale, never oversell
+            with self._lock:
+                self.journal.ack(batch[-1][0])
+                for _, entry in batch:
+                    self._add_queued(entry, -1)
+            self.batches += 1
+            for _, entry in batch:
+                latency = done - entry["taken_at"]
+                self._total_latency += latency
+                self._latency_count += 1
+                self.max_latency = max(self.max_latency, latency)
+            self.last_latency = done - batch[-1][1]["taken_at"]
+            with self._flushed:
+                self._flushed.notify_all()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._write_pending():
+                self._wake.wait()
+                self._wake.clear()
+            else:
+                self._stop.wait(RETRY_DELAY)
+
+    def stats(self):
+        """Return queue depth and flush latency (seconds from checkout to commit)."""
+        return {
+            "queued": len(self.journal),
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "last_flush_latency": self.last_latency,
+            "max_flush_latency": self.max_latency,
+            "avg_flush_latency": (self._total_latency / self._latency_count
+                                  if self._latency_count else 0.0),
+        }
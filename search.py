@@ -0,0 +1,320 @@
+"""In-memory product search over name, SKU and category.
+
+A query is answered in tiers, each only consulted while fewer than limit
+matches have been found:
+
+1. an exact SKU,
+2. names starting with the query (bisect over the sorted names),
+3. products where every query word starts one of their name, category or
+   SKU words (prefix postings, most selective word first, or a walk over
+   the sorted names when every word is common),
+4. the same with each query word that starts no indexed word swapped for
+   indexed words sharing most of its trigrams, so a typo such as "carlnig"
+   still finds "Carling".
+
+Everything is held in dicts, sets and sorted lists built from a catalogue
+snapshot, so a query runs no SQL. After a catalogue edit the next
+snapshot's index is derived from the previous one by re-indexing only the
+products whose name, category or SKU changed.
+"""
+import bisect
+import heapq
+import operator
+import re
+import unicodedata
+
+from product_table import HOME
+
+# Most matches returned by a query
+SEARCH_LIMIT = 12
+
+# Dice similarity of trigram sets a misspelt word needs with an indexed word
+FUZZY_MIN_SCORE = 0.5
+# Indexed words tried in place of each misspelt query word
+FUZZY_CANDIDATES = 5
+# Trigrams shared by more indexed words than this are too common to narrow
+# the candidates and are not looked up (they still count towards the score)
+FUZZY_MAX_POSTINGS = 2000
+
+# A query whose every word matches more products than this finds its matches
+# by walking the names in order instead of intersecting postings
+SCAN_THRESHOLD = 5000
+
+# Above this share of changed products, updated() rebuilds from scratch
+REBUILD_FRACTION = 4
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text):
+    """Lowercase text and strip accents, so "Rosé" and "rose" match."""
+    text = str(text or "").casefold()
+    if text.isascii():
+        return text
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def words(text):
+    """Return the lowercase alphanumeric words of text."""
+    return _WORD.findall(normalize(text))
+
+
+def trigrams(word_list):
+    """Return the distinct trigrams of some words, padded so word starts count."""
+    grams = set()
+    for word in word_list:
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+# The Product fields that are indexed: category, name and sku
+_searchable = operator.itemgetter(1, 2, 4)
+
+
+class SearchIndex:
+    """Prefix and trigram index over the products of a catalogue.ProductIndex.
+
+    Build one with SearchIndex(product_index) and derive the index for a
+    later catalogue with updated(); an index is never modified once built,
+    so it can be shared between threads.
+    """
+
+    def __init__(self, product_index=None):
+        self._index = product_index  # catalogue.ProductIndex the results come from
+        self._entries = {}     # id -> (sort key, words, (name, category, sku))
+        self._names = []       # sorted (normalized name, id)
+        self._words = []       # sorted distinct words
+        self._postings = {}    # word -> set of ids
+        self._grams = {}       # trigram -> set of indexed words
+        self._skus = {}        # normalized SKU -> id
+        self._owned = set()    # posting sets this index may modify in place
+        if product_index is not None:
+            self._build(product_index)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _own(self, table, key):
+        """Return table[key] as a set this index may modify, copying a shared one."""
+        postings = table.get(key)
+        if postings is None:
+            postings = table[key] = set()
+            self._owned.add(id(postings))
+        elif id(postings) not in self._owned:
+            postings = table[key] = set(postings)
+            self._owned.add(id(postings))
+        return postings
+
+    def _entry(self, product):
+        """Index one product's name, category and SKU; returns its sort key and words."""
+        name_words = words(product.name)
+        product_words = set(name_words)
+        product_words.update(words(product.category))
+        if product.sku:
+            sku = normalize(product.sku).strip()
+            product_words.add(sku)
+            self._skus[sku] = product.id
+        entry = self._entries[product.id] = ((" ".join(name_words), product.id), product_words, _searchable(product))
+        return entry
+
+    def _build(self, products):
+        postings = self._postings
+        for product in products:
+            sort_key, product_words, _ = self._entry(product)
+            self._names.append(sort_key)
+            for word in product_words:
+                word_postings = postings.get(word)
+                if word_postings is None:
+                    word_postings = postings[word] = set()
+                word_postings.add(product.id)
+        self._names.sort()
+        self._words = sorted(postings)
+        for word in self._words:
+            if word.isalpha():
+                for gram in trigrams([word]):
+                    gram_words = self._grams.get(gram)
+                    if gram_words is None:
+                        gram_words = self._grams[gram] = set()
+                    gram_words.add(word)
+
+    def _add(self, product):
+        sort_key, product_words, _ = self._entry(product)
+        bisect.insort(self._names, sort_key)
+        for word in product_words:
+            if word not in self._postings:
+                bisect.insort(self._words, word)
+                if word.isalpha():
+                    for gram in trigrams([word]):
+                        self._own(self._grams, gram).add(word)
+            self._own(self._postings, word).add(product.id)
+
+    def _remove(self, product_id):
+        sort_key, product_words, (_, _, sku) = self._entries.pop(product_id)
+        if sku and self._skus.get(normalize(sku).strip()) == product_id:
+            del self._skus[normalize(sku).strip()]
+        del self._names[bisect.bisect_left(self._names, sort_key)]
+        for word in product_words:
+            postings = self._own(self._postings, word)
+            postings.discard(product_id)
+            if postings:
+                continue
+            # Last product with this word: drop it from the vocabulary too
+            del self._postings[word]
+            del self._words[bisect.bisect_left(self._words, word)]
+            for gram in (trigrams([word]) if word.isalpha() else ()):
+                gram_words = self._own(self._grams, gram)
+                gram_words.discard(word)
+                if not gram_words:
+                    del self._grams[gram]
+
+    def updated(self, product_index):
+        """Return an index for product_index, re-indexing only the products that changed."""
+        entries = self._entries
+        current = set()
+        changed = []
+        # Compare the table rows directly; only changed ones are made into Products
+        table = product_index.products
+        for category in table:
+            if category == HOME:
+                continue
+            for name, _, sku, _, product_id, _ in table[category]:
+                current.add(product_id)
+                entry = entries.get(product_id)
+                if entry is None or entry[2] != (category, name, sku):
+                    changed.append(product_index.get(product_id))
+        removed = [product_id for product_id in entries if product_id not in current]
+        if (len(changed) + len(removed)) * REBUILD_FRACTION > max(len(current), 1):
+            return SearchIndex(product_index)
+
+        index = SearchIndex()
+        index._entries = dict(self._entries)
+        index._names = list(self._names)
+        index._words = list(self._words)
+        index._postings = dict(self._postings)
+        index._grams = dict(self._grams)
+        index._skus = dict(self._skus)
+        for product_id in removed:
+            index._remove(product_id)
+        for product in changed:
+            if product.id in index._entries:
+                index._remove(product.id)
+            index._add(product)
+        # Stock and prices are shown on the result buttons, so results come from the new catalogue
+        index._index = product_index
+        index._owned = set()
+        return index
+
+    def _prefix_words(self, term):
+        """Return the indexed words starting with term."""
+        return self._words[bisect.bisect_left(self._words, term):
+                           bisect.bisect_left(self._words, term + "\uffff")]
+
+    def _similar_words(self, term):
+        """Return up to FUZZY_CANDIDATES indexed words spelt most like term."""
+        grams = trigrams([term])
+        shared = {}
+        for gram in grams:
+            gram_words = self._grams.get(gram)
+            if gram_words is None or len(gram_words) > FUZZY_MAX_POSTINGS:
+                continue
+            for word in gram_words:
+                shared[word] = shared.get(word, 0) + 1
+        scored = []
+        for word in shared:
+            # Score on every trigram, including the common ones skipped above
+            word_grams = trigrams([word])
+            score = 2 * len(grams & word_grams) / (len(grams) + len(word_grams))
+            if score >= FUZZY_MIN_SCORE:
+                scored.append((-score, word))
+        return [word for _, word in heapq.nsmallest(FUZZY_CANDIDATES, scored)]
+
+    def _postings_size(self, matching_words, cap):
+        """Return how many postings matching_words have, counting no further than cap."""
+        size = 0
+        for word in matching_words:
+            size += len(self._postings[word])
+            if size > cap:
+                break
+        return size
+
+    def _word_matches(self, term_words, limit, seen):
+        """Return up to limit unseen ids, best first, of products having one of the given words for every term.
+
+        term_words is a list of word lists, one per query term.
+        """
+        entries = self._entries
+        sized = sorted((self._postings_size(matching_words, SCAN_THRESHOLD), i)
+                       for i, matching_words in enumerate(term_words))
+        allowed = [set(term_words[i]) for _, i in sized]
+        if sized[0][0] > SCAN_THRESHOLD:
+            # Every term is common, so matches are dense: walk the names in
+            # order and stop as soon as enough of them match
+            found = []
+            for _, product_id in self._names:
+                if product_id in seen:
+                    continue
+                product_words = entries[product_id][1]
+                if all(not words_allowed.isdisjoint(product_words) for words_allowed in allowed):
+                    found.append(product_id)
+                    if len(found) >= limit:
+                        break
+            return found
+
+        # Start from the term matching the fewest products and check the rest
+        # against each candidate's words
+        candidates = set()
+        for word in term_words[sized[0][1]]:
+            candidates |= self._postings[word]
+        candidates -= seen
+        for words_allowed in allowed[1:]:
+            candidates = {product_id for product_id in candidates
+                          if not words_allowed.isdisjoint(entries[product_id][1])}
+        return heapq.nsmallest(limit, candidates, key=lambda product_id: entries[product_id][0])
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Return up to limit Products matching query, best first."""
+        terms = words(query)
+        if not terms or limit <= 0:
+            return []
+        found = []
+        seen = set()
+
+        def take(product_ids):
+            for product_id in product_ids:
+                if product_id not in seen:
+                    seen.add(product_id)
+                    found.append(self._index.get(product_id))
+                    if len(found) >= limit:
+                        return True
+            return False
+
+        sku = self._skus.get(normalize(query).strip())
+        if sku is not None and take([sku]):
+            return found
+
+        prefix = " ".join(terms)
+        start = bisect.bisect_left(self._names, (prefix,))
+        names = []
+        for name_key, product_id in self._names[start:start + limit]:
+            if not name_key.startswith(prefix):
+                break
+            names.append(product_id)
+        if take(names):
+            return found
+
+        term_words = [self._prefix_words(term) for term in terms]
+        if all(term_words):
+            if take(self._word_matches(term_words, limit - len(found), seen)):
+                return found
+
+        # Swap words that start nothing in the index for ones spelt like them
+        misspelt = False
+        for i, term in enumerate(terms):
+            if not term_words[i] and len(term) >= 3:
+                term_words[i] = self._similar_words(term)
+                misspelt = True
+        if misspelt and all(term_words):
+            take(self._word_matches(term_words, limit - len(found), seen))
+        return found
@@ -0,0 +1,87 @@
+"""Production entry point: serves the POS under a multi-threaded WSGI server.
+
+    python serve.py                   # waitress, 8 threads on port 8050
+    python serve.py --threads 16
+    python serve.py --workers 4       # gunicorn worker processes (not on Windows)
+
+Every option can also be set from the environment (POS_HOST, POS_PORT,
+POS_THREADS, POS_WORKERS), so throughput can be tuned without editing
+source. Dash debug mode, the debugger and the reloader are never enabled
+here; use ``python app.py`` for development.
+"""
+import argparse
+import os
+import sys
+
+import db
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 8050
+DEFAULT_THREADS = 8
+
+
+def load_app(threads):
+    """Import the Dash app with enough pooled connections for every server thread."""
+    db.POOL_MAX_SIZE = max(db.POOL_MAX_SIZE, threads)
+    import app
+    return app
+
+
+def serve_waitress(host, port, threads):
+    """Serve from one process with a pool of request threads (works on Windows)."""
+    from waitress import serve
+
+    app = load_app(threads)
+    print(f"POS serving on http://{host}:{port} with {threads} threads")
+    serve(app.app.server, host=host, port=port, threads=threads)
+
+
+def serve_gunicorn(host, port, workers, threads):
+    """Serve from several worker processes, each with its own request threads."""
+    from gunicorn.app.base import BaseApplication
+
+    class POSApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            app = load_app(threads)
+            # The app is loaded once before forking; every worker opens its own
+            # connections (the pool is per process), so close the parent's here
+            db.close_pool()
+            return app.app.server
+
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gthread",
+        "preload_app": True,
+    }
+    POSApplication().run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the POS with a production WSGI server")
+    parser.add_argument("--host", default=os.environ.get("POS_HOST", DEFAULT_HOST))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("POS_PORT", DEFAULT_PORT)))
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("POS_THREADS", DEFAULT_THREADS)),
+                        help="request threads per process")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("POS_WORKERS", 1)),
+                        help="worker processes; more than 1 needs gunicorn")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        if sys.platform == "win32":
+            parser.error("multiple worker processes are not supported on Windows; raise --threads instead")
+        # The sale journal and the till sync outbox belong to a single process
+        if os.environ.get("POS_WRITE_BEHIND") == "1" or os.environ.get("POS_SYNC_URL"):
+            parser.error("POS_WRITE_BEHIND and POS_SYNC_URL need a single worker; raise --threads instead")
+        serve_gunicorn(args.host, args.port, args.workers, args.threads)
+    else:
+        serve_waitress(args.host, args.port, args.threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Sync server for running several tills against one shared store.
+
+One process owns the central database. Tills POST their checkouts to it
+(see till_sync.SyncClient) and long-poll it for catalogue changes, which
+are pushed back out to every till as soon as they are committed.
+
+    python till_server.py --db central.db --port 8060
+
+API (all JSON):
+    POST /orders     {"orders": [{"ref", "till", "taken_at", "lines": [{"category", "name", "quantity", "unit_price"}]}]}
+                     -> {"accepted": [ref, ...], "rejected": [{"ref", "error"}, ...], "retry": [ref, ...]}
+                        rejected orders can never be recorded; retry ones failed this time
+                        and should be sent again. 503 if the database could not be written.
+    GET  /catalogue?since=<version>&wait=<seconds>
+                     -> {"version", "products": [[category, name, price, sku, stock], ...]}
+                        once the central catalogue version differs from since
+    GET  /health     -> {"status": "ok", "catalogue_version"}
+
+Prices (price, unit_price) are integer pence; taken_at is Unix seconds.
+"""
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import db
+from catalogue import CatalogueStore
+
+# Longest a catalogue long-poll is held open before returning "no change"
+MAX_CATALOGUE_WAIT = 30.0
+
+
+class SyncServer:
+    """Records forwarded orders and serves the catalogue to tills."""
+
+    def __init__(self, check_interval=0.25):
+        self.catalogue = CatalogueStore(check_interval=check_interval)
+        self.check_interval = check_interval
+        self._changed = threading.Condition()
+        self._version, self._rows = db.get_catalogue_rows()
+        db.on_catalogue_change(self._catalogue_changed)
+
+    def _catalogue_changed(self):
+        version, rows = db.get_catalogue_rows()
+        with self._changed:
+            self._version, self._rows = version, rows
+            self._changed.notify_all()
+
+    def catalogue_version(self):
+        """Return the central catalogue version last seen."""
+        with self._changed:
+            return self._version
+
+    def record_orders(self, orders):
+        """Record a batch of forwarded orders in one transaction, idempotently by ref."""
+        accepted, rejected, retry = [], [], []
+        snapshot = self.catalogue.current()
+        with db.get_db_connection() as conn:
+            # One transaction (and one fsync) per batch; each order gets its own savepoint
+            conn.execute("BEGIN IMMEDIATE")
+            for order in orders:
+                lines = []
+                missing = []
+                for line in order["lines"]:
+                    product = snapshot.index.find(line["category"], line["name"])
+                    if product is None:
+                        missing.append(f"{line['category']}/{line['name']}")
+                    else:
+                        lines.append((product.id, line["quantity"], line.get("unit_price")))
+                if missing:
+                    rejected.append({"ref": order["ref"], "error": f"unknown products: {', '.join(missing)}"})
+                    continue
+                # The sale already happened at the till, so stock is allowed to go negative here
+                if db.record_order(lines, client_ref=order["ref"], till_id=order.get("till"), check_stock=False,
+                                   taken_at=order.get("taken_at")):
+                    accepted.append(order["ref"])
+                else:
+                    # A database error, not a bad order: the till keeps it and sends it again
+                    retry.append(order["ref"])
+        return {"accepted": accepted, "rejected": rejected, "retry": retry}
+
+    def wait_for_catalogue(self, since, wait):
+        """Return the catalogue once its version differs from since, or None after wait seconds."""
+        deadline = time.monotonic() + min(wait, MAX_CATALOGUE_WAIT)
+        while True:
+            self.catalogue.current()  # notices writes made by other processes
+            with self._changed:
+                if self._version != since:
+                    return {"version": self._version, "products": self._rows}
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(min(remaining, self.check_interval))
+
+
+class SyncRequestHandler(BaseHTTPRequestHandler):
+    server_version = "POSSync/1.0"
+    sync = None  # set by serve()
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/health":
+            self._send_json(200, {"status": "ok", "catalogue_version": self.sync.catalogue_version()})
+        elif url.path == "/catalogue":
+            since = int(query.get("since", ["-1"])[0])
+            wait = float(query.get("wait", ["0"])[0])
+            catalogue = self.sync.wait_for_catalogue(since, wait)
+            if catalogue is None:
+                self.send_response(304)
+                self.end_headers()
+            else:
+                self._send_json(200, catalogue)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/orders":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length))
+            result = self.sync.record_orders(payload["orders"])
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except sqlite3.Error as e:
+            print(f"Error recording forwarded orders: {e}")
+            self._send_json(503, {"error": "orders could not be recorded"})
+            return
+        self._send_json(200, result)
+
+    def log_message(self, format, *args):
+        pass  # one line per request would drown the console
+
+
+def serve(host="0.0.0.0", port=8060):
+    """Run the sync server until interrupted."""
+    db.init_db()
+    SyncRequestHandler.sync = SyncServer()
+    httpd = ThreadingHTTPServer((host, port), SyncRequestHandler)
+    httpd.daemon_threads = True
+    print(f"Till sync server on http://{host}:{port} using {db.DB_FILE}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Central sync server for multiple POS tills")
+    parser.add_argument("--db", default=db.DB_FILE, help="central database file")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8060)
+    args = parser.parse_args()
+    db.DB_FILE = args.db
+    serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
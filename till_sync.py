@@ -0,0 +1,161 @@
+"""Till side of multi-till mode: forwards checkouts to the sync server.
+
+Every checkout is appended to a local journal before anything is sent, so
+orders survive a dropped link or a restart and are replayed to the server
+in the order they were taken. A second thread long-polls the server for
+catalogue changes and applies them to the till's own database.
+"""
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import db
+from journal import Journal
+
+# Orders sent per POST when catching up on a backlog
+SEND_BATCH_SIZE = 100
+# Seconds to wait before retrying after the server could not be reached
+RETRY_DELAY = 2.0
+# How long each catalogue long-poll may be held open by the server
+CATALOGUE_WAIT = 25.0
+
+
+class SyncClient:
+    """Queues this till's orders for the sync server and keeps its catalogue current."""
+
+    def __init__(self, server_url, till_id, journal_path="till_outbox.journal", rejected_path=None,
+                 timeout=10.0):
+        self.server_url = server_url.rstrip("/")
+        self.till_id = till_id
+        self.timeout = timeout
+        self.journal = Journal(journal_path)
+        # Orders the server refused for good, with its reason, kept until someone deals with them
+        self.rejected = Journal(rejected_path or os.path.splitext(journal_path)[0] + ".rejected.journal")
+        self.catalogue_version = -1
+        self.sent = 0
+        self.connected = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self, sync_catalogue=True):
+        """Start the background sender (and catalogue) threads."""
+        targets = [self._send_loop] + ([self._catalogue_loop] if sync_catalogue else [])
+        for target in targets:
+            thread = threading.Thread(target=target, name=f"till-sync-{target.__name__}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=5.0):
+        """Stop the background threads, leaving unsent orders in the journal."""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, items):
+        """Queue a checkout for the server; returns its reference once it is on disk.
+
+        items are basket lines with category, name, count and price, as kept
+        in order-store.
+        """
+        record = {
+            "ref": f"{self.till_id}-{uuid.uuid4().hex}",
+            "till": self.till_id,
+            "taken_at": time.time(),
+            "lines": [
+                {"category": item["category"], "name": item["name"],
+                 "quantity": item.get("count", 1), "unit_price": item["price"]}
+                for item in items
+            ],
+        }
+        self.journal.append(record)
+        self._wake.set()
+        return record["ref"]
+
+    def _request(self, path, payload=None, timeout=None):
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        request = urllib.request.Request(
+            self.server_url + path, data=data,
+            headers={"Content-Type": "application/json"} if data else {}
+        )
+        # A 304 (catalogue unchanged) surfaces as HTTPError; a server dying
+        # mid-response raises http.client.HTTPException rather than OSError
+        with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+            return json.loads(response.read())
+
+    def flush(self):
+        """Send queued orders, oldest first, until the journal is empty or a send fails."""
+        while not self._stop.is_set():
+            batch = self.journal.pending(SEND_BATCH_SIZE)
+            if not batch:
+                return True
+            try:
+                result = self._request("/orders", {"orders": [record for _, record in batch]})
+            except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError):
+                self.connected = False
+                return False
+            self.connected = True
+            accepted = set(result.get("accepted", []))
+            rejected = {entry["ref"]: entry["error"] for entry in result.get("rejected", [])}
+            delivered = 0
+            for seq, record in batch:
+                ref = record["ref"]
+                if ref in rejected:
+                    # Rejected orders (e.g. products the server does not know) cannot succeed
+                    # on retry, so they are set aside on disk rather than blocking the queue
+                    self.rejected.append({"error": rejected[ref], "order": record})
+                elif ref in accepted:
+                    self.sent += 1
+                else:
+                    break  # not recorded this time: keep it, and everything after it, queued
+                delivered = seq
+            if delivered:
+                self.journal.ack(delivered)
+            if delivered != batch[-1][0]:
+                return False
+        return False
+
+    def _send_loop(self):
+        while not self._stop.is_set():
+            if self.flush():
+                self._wake.wait()
+                self._wake.clear()
+            else:
+                self._stop.wait(RETRY_DELAY)
+
+    def _catalogue_loop(self):
+        while not self._stop.is_set():
+            try:
+                catalogue = self._request(
+                    f"/catalogue?since={self.catalogue_version}&wait={CATALOGUE_WAIT}",
+                    timeout=CATALOGUE_WAIT + self.timeout
+                )
+            except urllib.error.HTTPError as e:
+                if e.code == 304:
+                    continue
+                self._stop.wait(RETRY_DELAY)
+                continue
+            except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError):
+                self._stop.wait(RETRY_DELAY)
+                continue
+            report = db.apply_catalogue(catalogue["products"])
+            for ref, message in report["errors"]:
+                print(f"Catalogue sync skipped row {ref}: {message}")
+            self.catalogue_version = catalogue["version"]
+
+    def stats(self):
+        """Return queue depth and delivery counters."""
+        return {
+            "queued": len(self.journal),
+            "sent": self.sent,
+            "rejected": len(self.rejected),
+            "connected": self.connected,
+            "catalogue_version": self.catalogue_version,
+        }